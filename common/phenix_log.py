@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Single pass parser for phenix.model_statistics logs, also for bulk re-mining of archived logs"""
+import argparse
+import csv
+import dataclasses
+import gzip
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)"
+
+# One alternative per statistic, every value is a named group. Lines have to
+# match the whole label, e.g. "Bond angle restraints" is not the bond RMSD.
+LOG_PATTERN = re.compile("|".join([
+    rf"^[ \t]*Bond[ \t]*:[ \t]*(?P<bond_rmsd>{NUMBER})",
+    rf"^[ \t]*Angle[ \t]*:[ \t]*(?P<angle_rmsd>{NUMBER})",
+    rf"^[ \t]*Ramachandran Plot:[ \t]*\n"
+    rf"[ \t]*Outliers[ \t]*:[ \t]*(?P<rama_outliers>{NUMBER})[ \t]*%?[ \t]*\n"
+    rf"[ \t]*Allowed[ \t]*:[ \t]*(?P<rama_allowed>{NUMBER})[ \t]*%?[ \t]*\n"
+    rf"[ \t]*Favored[ \t]*:[ \t]*(?P<rama_favored>{NUMBER})",
+    # "Rotamer Outliers : 0.4 %" and newer logs with a "Rotamer:" block
+    rf"^[ \t]*Rotamer(?:[ \t]+Outliers|:[ \t]*\n[ \t]*Outliers)[ \t]*:[ \t]*(?P<rotamer_outliers>{NUMBER})",
+    rf"^[ \t]*All-atom Clashscore[ \t]*:[ \t]*(?P<clashscore>{NUMBER})",
+    # ADP table: atoms, anisotropic atoms, then the mean B factor
+    rf"^[ \t]*Overall:[ \t]*\S+[ \t]+\S+[ \t]+(?P<b_overall>{NUMBER})",
+    rf"^[ \t]*Protein:[ \t]*\S+[ \t]+\S+[ \t]+(?P<b_protein>{NUMBER})",
+    rf"^[ \t]*Water:[ \t]*\S+[ \t]+\S+[ \t]+(?P<b_water>{NUMBER})",
+]), re.MULTILINE)
+
+
+@dataclasses.dataclass
+class ModelStatistics:
+    """Statistics of one phenix.model_statistics run, None if not in the log"""
+    bond_rmsd: float = None
+    angle_rmsd: float = None
+    rama_favored: float = None
+    rama_allowed: float = None
+    rama_outliers: float = None
+    rotamer_outliers: float = None
+    clashscore: float = None
+    b_overall: float = None
+    b_protein: float = None
+    b_water: float = None
+
+    def as_dict(self):
+        """Nested dict as used by table1 and quick_validation"""
+        return {"Bond RMSD": self.bond_rmsd,
+                "Angle RMSD": self.angle_rmsd,
+                "Ramachandran": {"Favored": self.rama_favored, "Allowed": self.rama_allowed, "Outliers": self.rama_outliers},
+                "Rotamer Outliers": self.rotamer_outliers,
+                "All-atom Clashscore": self.clashscore,
+                "Average B factor": {"Overall": self.b_overall, "Protein": self.b_protein, "Water": self.b_water}}
+
+    @classmethod
+    def from_dict(cls, statistics):
+        """Inverse of as_dict"""
+        return cls(bond_rmsd=statistics["Bond RMSD"],
+                   angle_rmsd=statistics["Angle RMSD"],
+                   rama_favored=statistics["Ramachandran"]["Favored"],
+                   rama_allowed=statistics["Ramachandran"]["Allowed"],
+                   rama_outliers=statistics["Ramachandran"]["Outliers"],
+                   rotamer_outliers=statistics["Rotamer Outliers"],
+                   clashscore=statistics["All-atom Clashscore"],
+                   b_overall=statistics["Average B factor"]["Overall"],
+                   b_protein=statistics["Average B factor"]["Protein"],
+                   b_water=statistics["Average B factor"]["Water"])
+
+
+FIELDS = [field.name for field in dataclasses.fields(ModelStatistics)]
+
+
+def parse_log(text):
+    """ModelStatistics of a phenix.model_statistics log (first value of every statistic wins)"""
+    values = {}
+    for match in LOG_PATTERN.finditer(text):
+        for name, value in match.groupdict().items():
+            if value is not None and name not in values:
+                values[name] = float(value)
+    return ModelStatistics(**values)
+
+
+def parse_log_file(log_file):
+    """Parse a (gzipped) log file"""
+    opener = gzip.open if str(log_file).endswith(".gz") else open
+    with opener(log_file, "rt", errors="replace") as log:
+        return parse_log(log.read())
+
+
+def parse_log_files(log_files, max_workers=None):
+    """Parse many log files in parallel, yields (file, ModelStatistics or error) in input order"""
+    log_files = list(log_files)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_parse_or_error, log_files, chunksize=max(1, len(log_files) // 64))
+        yield from zip(log_files, results)
+
+
+def _parse_or_error(log_file):
+    """parse_log_file, but return the error instead of raising it (keeps the bulk run going)"""
+    try:
+        return parse_log_file(log_file)
+    except (OSError, UnicodeDecodeError, EOFError) as e:
+        return e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse archived phenix.model_statistics logs into one csv table")
+    parser.add_argument("logs", help="Log files (.gz allowed)", nargs="+")
+    parser.add_argument("-o", "--output", help="Output csv (default: stdout)", required=False)
+    parser.add_argument("-j", "--jobs", help="Number of parallel processes (default: number of CPUs)", type=int, default=None)
+    args = parser.parse_args()
+
+    out_file = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = csv.writer(out_file)
+    writer.writerow(["log"] + FIELDS)
+    failed = 0
+    for log_file, statistics in parse_log_files(args.logs, max_workers=args.jobs):
+        if isinstance(statistics, Exception):
+            print(f"Error reading {log_file}: {statistics}", file=sys.stderr)
+            failed += 1
+            continue
+        writer.writerow([log_file] + [getattr(statistics, field) for field in FIELDS])
+    if args.output:
+        out_file.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,99 @@
+"""Run phenix.model_statistics and cache the parsed results on disk"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from phenix_log import parse_log
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                         "misc_xtal_stuff", "model_statistics")
+# Least recently used entries are removed once the cache grows beyond this size
+CACHE_SIZE = 50 * 1024 * 1024
+# Part of the cache key, bump when the parsed output changes so that old entries are not served
+PARSER_VERSION = 2
+
+
+def parse_model_statistics(stdout):
+    """Get all parameters from the phenix.model_statistics output"""
+    return parse_log(stdout).as_dict()
+
+
+def phenix_version():
+    """Identify the phenix installation (PHENIX_VERSION from phenix_env or the executable path)"""
+    version = os.environ.get("PHENIX_VERSION")
+    if version:
+        return version
+    executable = shutil.which("phenix.model_statistics")
+    return os.path.realpath(executable) if executable else "unknown"
+
+
+def file_digest(file_name):
+    """sha256 of the file content"""
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(model_file, cif_files=None):
+    """Key from model content, restraint file contents, phenix version and parser version"""
+    key = hashlib.sha256()
+    key.update(file_digest(model_file).encode())
+    # The order of the restraint files does not change the result
+    for cif_digest in sorted(file_digest(cif) for cif in cif_files or []):
+        key.update(cif_digest.encode())
+    key.update(phenix_version().encode())
+    key.update(f"parser {PARSER_VERSION}".encode())
+    return key.hexdigest()
+
+
+def _evict(cache_dir, max_size):
+    """Remove least recently used entries until the cache fits into max_size bytes"""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".json"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def model_statistics(model_file, cif_files=None, use_cache=True, cache_dir=CACHE_DIR, max_size=CACHE_SIZE):
+    """Parsed phenix.model_statistics results, taken from the cache if the inputs are unchanged
+
+    Raises subprocess.CalledProcessError if phenix fails, failed runs are not cached.
+    """
+    if use_cache:
+        key = cache_key(model_file, cif_files)
+        cache_file = os.path.join(cache_dir, f"{key}.json")
+        try:
+            with open(cache_file, "r") as cached:
+                statistics = json.load(cached)
+            os.utime(cache_file)  # mark as recently used
+            return statistics
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    ref_stats_command = ["phenix.model_statistics", str(model_file)] + [str(cif) for cif in cif_files or []]
+    ref_stats = subprocess.run(ref_stats_command, capture_output=True, text=True, check=True)
+    statistics = parse_model_statistics(ref_stats.stdout)
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as out_file:
+            json.dump(statistics, out_file)
+        os.replace(tmp_file, cache_file)
+        _evict(cache_dir, max_size)
+
+    return statistics
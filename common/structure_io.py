@@ -0,0 +1,225 @@
+"""Minimal PDB/mmCIF coordinate reader returning numpy column arrays"""
+import re
+import numpy as np
+
+WATER_NAMES = ["HOH", "WAT", "DOD", "H2O"]
+
+# One letter codes of polymer residues, modified residues map to their parent
+ONE_LETTER = {"ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C", "GLN": "Q", "GLU": "E",
+              "GLY": "G", "HIS": "H", "ILE": "I", "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F",
+              "PRO": "P", "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V",
+              "SEC": "U", "PYL": "O", "ASX": "B", "GLX": "Z", "UNK": "X",
+              # Modified amino acids
+              "MSE": "M", "FME": "M", "SEP": "S", "TPO": "T", "PTR": "Y", "TYS": "Y",
+              "CSO": "C", "CSD": "C", "CME": "C", "OCS": "C", "CAS": "C", "CSX": "C", "SNC": "C", "CSS": "C",
+              "KCX": "K", "MLY": "K", "MLZ": "K", "M3L": "K", "ALY": "K", "LLP": "K",
+              "HYP": "P", "PCA": "E", "CGU": "E", "NEP": "H", "HIC": "H", "MLE": "L", "NLE": "L",
+              "MVA": "V", "AIB": "A", "DAL": "A", "SAR": "G",
+              # Nucleotides
+              "DA": "A", "DC": "C", "DG": "G", "DT": "T", "DU": "U", "A": "A", "C": "C", "G": "G", "U": "U"}
+
+# Fixed PDB columns (start, end) of ATOM/HETATM records
+PDB_COLUMNS = {"record": (0, 6), "name": (12, 16), "altloc": (16, 17), "resn": (17, 20),
+               "chain": (21, 22), "resi": (22, 26), "icode": (26, 27),
+               "x": (30, 38), "y": (38, 46), "z": (46, 54),
+               "occupancy": (54, 60), "b": (60, 66), "element": (76, 78)}
+
+# mmCIF _atom_site items for each column, the first one found is used
+CIF_ITEMS = {"record": ["group_PDB"], "name": ["auth_atom_id", "label_atom_id"],
+             "altloc": ["label_alt_id"], "resn": ["auth_comp_id", "label_comp_id"],
+             "chain": ["auth_asym_id", "label_asym_id"], "resi": ["auth_seq_id", "label_seq_id"],
+             "icode": ["pdbx_PDB_ins_code"], "x": ["Cartn_x"], "y": ["Cartn_y"], "z": ["Cartn_z"],
+             "occupancy": ["occupancy"], "b": ["B_iso_or_equiv"], "element": ["type_symbol"],
+             "model": ["pdbx_PDB_model_num"]}
+
+FLOAT_COLUMNS = ["x", "y", "z", "occupancy", "b"]
+
+# mmCIF tokens: quoted strings may contain quotes that are not followed by whitespace
+CIF_TOKEN = re.compile(r"""'(?:[^']|'(?=\S))*'|"(?:[^"]|"(?=\S))*"|\S+""")
+
+
+def _pdb_column(chars, start, end):
+    """Cut one fixed width column out of the (atoms x 80) character array"""
+    return np.ascontiguousarray(chars[:, start:end]).view(f"S{end - start}").ravel()
+
+
+def read_pdb(pdb_file):
+    """Read ATOM/HETATM records of the first model of a PDB file"""
+    lines = []
+    with open(pdb_file, "rb") as pdb:
+        for line in pdb:
+            if line.startswith((b"ATOM  ", b"HETATM")):
+                lines.append(line.rstrip(b"\r\n"))
+            elif line.startswith(b"ENDMDL"):
+                break
+
+    chars = np.array(lines, dtype="S80").view("S1").reshape(len(lines), 80)
+    atoms = {}
+    for column, (start, end) in PDB_COLUMNS.items():
+        values = _pdb_column(chars, start, end)
+        if column in FLOAT_COLUMNS:
+            # Missing occupancy/B columns are read as 0
+            values = np.where(np.char.strip(values) == b"", b"0", values)
+            atoms[column] = values.astype(np.float64)
+        elif column == "resi":
+            atoms[column] = values.astype(np.int64)
+        else:
+            atoms[column] = np.char.strip(values).astype(str)
+    return atoms
+
+
+def _cif_value(token):
+    """Strip quotes and convert unknown/inapplicable values to empty strings"""
+    if token in (".", "?"):
+        return ""
+    if token[0] in "'\"":
+        return token[1:-1]
+    return token
+
+
+def read_cif(cif_file):
+    """Read the _atom_site loop of the first model of an mmCIF file"""
+    items = []
+    rows = []
+    in_loop = False
+    reading_rows = False
+    pending = []
+
+    with open(cif_file, "r") as cif:
+        for line in cif:
+            if not reading_rows:
+                if line.startswith("loop_"):
+                    in_loop = True
+                    items = []
+                elif in_loop and line.startswith("_atom_site."):
+                    items.append(line.split()[0][len("_atom_site."):])
+                elif in_loop and items:
+                    reading_rows = True
+                else:
+                    in_loop = False
+                if not reading_rows:
+                    continue
+
+            if line.startswith(("_", "loop_", "#", "data_")):
+                break
+            tokens = line.split() if "'" not in line and '"' not in line else CIF_TOKEN.findall(line)
+            pending.extend(tokens)
+            # A row can be continued on the next line
+            if len(pending) >= len(items):
+                rows.append(pending[:len(items)])
+                pending = []
+
+    columns = list(zip(*rows)) if rows else [()] * len(items)
+    atoms = {}
+    for column, candidates in CIF_ITEMS.items():
+        for item in candidates:
+            if item in items:
+                atoms[column] = [_cif_value(token) for token in columns[items.index(item)]]
+                break
+        else:
+            atoms[column] = [""] * len(rows)
+
+    for column in FLOAT_COLUMNS:
+        atoms[column] = np.array([value or 0 for value in atoms[column]], dtype=np.float64)
+    atoms["resi"] = np.array([value or 0 for value in atoms["resi"]], dtype=np.int64)
+    for column in ["record", "name", "altloc", "resn", "chain", "icode", "element", "model"]:
+        atoms[column] = np.array(atoms[column], dtype=str)
+
+    # Only keep the first model
+    model = atoms.pop("model")
+    if len(model) and model[0]:
+        first = model == model[0]
+        if not first.all():
+            atoms = {column: values[first] for column, values in atoms.items()}
+    return atoms
+
+
+def read_structure(model_file):
+    """Read a PDB or mmCIF file into a dict of numpy arrays (one entry per atom)
+
+    Columns: record, name, altloc, resn, chain, resi, icode, x, y, z, occupancy, b, element
+    """
+    if str(model_file).lower().endswith((".cif", ".mmcif")):
+        atoms = read_cif(model_file)
+    else:
+        atoms = read_pdb(model_file)
+
+    # Element column is optional in PDB files, guess it from the atom name
+    missing = atoms["element"] == ""
+    if missing.any():
+        guessed = np.char.lstrip(atoms["name"], "0123456789").astype("U1")
+        atoms["element"] = np.where(missing, guessed, atoms["element"])
+    atoms["element"] = np.char.upper(atoms["element"])
+    return atoms
+
+
+def residue_starts(atoms):
+    """Index of the first atom of every residue (chain, number and insertion code change)"""
+    chain, resi, icode = atoms["chain"], atoms["resi"], atoms["icode"]
+    new = np.ones(len(chain), dtype=bool)
+    new[1:] = (chain[1:] != chain[:-1]) | (resi[1:] != resi[:-1]) | (icode[1:] != icode[:-1])
+    return np.flatnonzero(new)
+
+
+def chain_sequences(atoms):
+    """One letter sequence of every chain, chains in order of appearance
+
+    Standard and modified amino acids (and nucleotides) are used, other HETATM
+    residues (ligands, water) are skipped, unknown ATOM residues become X.
+    Residues with insertion codes count as separate residues.
+    """
+    starts = residue_starts(atoms)
+    resn = atoms["resn"][starts]
+    chains = atoms["chain"][starts]
+    polymer = atoms["record"][starts] == "ATOM"
+
+    unique_resn, inverse = np.unique(resn, return_inverse=True)
+    codes = np.array([ONE_LETTER.get(name, "") for name in unique_resn] or [""], dtype="U1")[inverse]
+    known = codes != ""
+    codes = np.where(polymer & ~known, "X", codes)
+    keep = polymer | known
+
+    sequences = {}
+    unique_chains, first = np.unique(chains[keep], return_index=True)
+    for chain in unique_chains[np.argsort(first)]:
+        sequences[str(chain)] = "".join(codes[keep & (chains == chain)])
+    return sequences
+
+
+def _group_means(values, keys):
+    """Mean of values for every unique key, keys in order of appearance"""
+    if not len(values):
+        return {}
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse, weights=values)
+    counts = np.bincount(inverse)
+    order = np.argsort(first)
+    return {str(unique[i]): float(sums[i] / counts[i]) for i in order}
+
+
+def b_factor_summary(atoms, ligand_name=None):
+    """Average B factors for all atoms, protein, water and ligand(s)
+
+    Ligand atoms are selected by residue name, if no name is given all non-water
+    HETATM records are used. Also returns per chain and per ligand instance means.
+    """
+    b = atoms["b"]
+    water = np.isin(atoms["resn"], WATER_NAMES)
+    protein = (atoms["record"] == "ATOM") & ~water
+    if ligand_name:
+        ligand = np.isin(atoms["resn"], np.atleast_1d(ligand_name))
+    else:
+        ligand = (atoms["record"] == "HETATM") & ~water
+
+    def mean(mask):
+        return float(b[mask].mean()) if mask.any() else None
+
+    instances = np.char.add(np.char.add(atoms["chain"], "/"),
+                            np.char.add(np.char.add(atoms["resn"], " "),
+                                        np.char.add(atoms["resi"].astype(str), atoms["icode"])))
+    return {"Overall": float(b.mean()) if len(b) else None,
+            "Protein": mean(protein),
+            "Water": mean(water),
+            "Ligand": mean(ligand),
+            "Chains": _group_means(b, atoms["chain"]),
+            "Ligand Instances": _group_means(b[ligand], instances[ligand])}
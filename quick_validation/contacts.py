@@ -0,0 +1,135 @@
+"""Close contact search with a cell list over numpy coordinates"""
+import itertools
+import numpy as np
+
+from structure_io import ONE_LETTER, WATER_NAMES, residue_starts
+
+# Neighbour cells of one cell, the half shell visits every pair of cells once
+FULL_SHELL = list(itertools.product((-1, 0, 1), repeat=3))
+HALF_SHELL = [offset for offset in FULL_SHELL if offset > (0, 0, 0)]
+
+POLAR_ELEMENTS = ["N", "O"]
+# Polar backbone atoms that are close across the bond between consecutive polymer residues (O(i)-N(i+1) ~2.25 A)
+LINK_ATOMS = ["N", "O", "OXT", "O3'", "O5'", "OP1", "OP2", "O1P", "O2P"]
+
+
+def _expand(starts, counts):
+    """Indices start, start + 1, ..., start + count - 1 for all (start, count)"""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def find_pairs(coords, cutoff, query=None, chunk_size=200000):
+    """Atom pairs (i < j) closer or equal to cutoff and their distances
+
+    Atoms are sorted into cubic cells with the cutoff as edge length, so only
+    atoms of neighbouring cells are compared and the work grows linearly with
+    the number of atoms. With query (atom indices) only pairs with at least one
+    query atom are returned.
+    """
+    # An empty query happens when only residues without polar atoms changed (e.g. a moved ion)
+    if len(coords) < 2 or (query is not None and len(query) == 0):
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+
+    # Cells with one empty layer around so that neighbour keys never wrap
+    cells = np.floor((coords - coords.min(axis=0)) / cutoff).astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    # Work on atoms sorted by cell, neighbour lookups then walk memory in order
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    coords = coords[order]
+
+    if query is None:
+        atoms = np.arange(len(coords))
+        shell = [(0, 0, 0)] + HALF_SHELL
+    else:
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        atoms = np.sort(position[np.unique(query)])
+        shell = FULL_SHELL
+
+    pairs = []
+    distances = []
+    for chunk in range(0, len(atoms), chunk_size):
+        first = atoms[chunk:chunk + chunk_size]
+        for dx, dy, dz in shell:
+            neighbour_keys = keys[first] + (dx * dims[1] + dy) * dims[2] + dz
+            starts = np.searchsorted(keys, neighbour_keys, side="left")
+            counts = np.searchsorted(keys, neighbour_keys, side="right") - starts
+            i = np.repeat(first, counts)
+            j = _expand(starts, counts)
+            if query is None and (dx, dy, dz) == (0, 0, 0):
+                keep = i < j
+            else:
+                keep = i != j
+            i, j = i[keep], j[keep]
+            distance = np.sqrt(((coords[i] - coords[j]) ** 2).sum(axis=1))
+            close = distance <= cutoff
+            i, j = order[i[close]], order[j[close]]
+            pairs.append(np.column_stack([np.minimum(i, j), np.maximum(i, j)]))
+            distances.append(distance[close])
+
+    pairs = np.concatenate(pairs)
+    distances = np.concatenate(distances)
+    if query is not None:
+        # Pairs of two query atoms are found twice
+        pairs, unique = np.unique(pairs, axis=0, return_index=True)
+        distances = distances[unique]
+    return pairs, distances
+
+
+def residue_index(atoms):
+    """Running residue number of every atom"""
+    new = np.zeros(len(atoms["chain"]), dtype=np.int64)
+    new[residue_starts(atoms)] = 1
+    return np.cumsum(new) - 1
+
+
+def inorganic(atoms, residues=None):
+    """Atoms of non-polymer, non-water residues without carbon (ions, sulfate, ...)"""
+    residues = residue_index(atoms) if residues is None else residues
+    has_carbon = np.bincount(residues, weights=atoms["element"] == "C") > 0
+    water = np.isin(atoms["resn"], WATER_NAMES)
+    return (atoms["record"] == "HETATM") & ~water & ~has_carbon[residues]
+
+
+def atom_labels(atoms, indices):
+    """chain/resn resi/name labels of the given atoms"""
+    labels = []
+    for i in indices:
+        altloc = f".{atoms['altloc'][i]}" if atoms["altloc"][i] else ""
+        labels.append(f"{atoms['chain'][i]}/{atoms['resn'][i]} {atoms['resi'][i]}{atoms['icode'][i]}/{atoms['name'][i]}{altloc}")
+    return labels
+
+
+def polar_contacts(atoms, cutoff=2.2, query=None):
+    """Pairs of polar atoms (N, O) closer or equal to cutoff, excluding inorganics
+
+    Pairs within a residue, between backbone atoms of consecutive polymer residues
+    of a chain (peptide bond) and between different alternate conformations are
+    not reported. Returns the atom index pairs and distances, query works as in
+    find_pairs.
+    """
+    residues = residue_index(atoms)
+    selected = np.flatnonzero(np.isin(atoms["element"], POLAR_ELEMENTS) & ~inorganic(atoms, residues))
+    if query is not None:
+        query = np.flatnonzero(np.isin(selected, query))
+    pairs, distances = find_pairs(np.column_stack([atoms["x"], atoms["y"], atoms["z"]])[selected], cutoff, query=query)
+    pairs = selected[pairs]
+
+    first, second = pairs[:, 0], pairs[:, 1]
+    # Modified residues are often HETATM records but still part of the chain
+    polymer = (atoms["record"] == "ATOM") | np.isin(atoms["resn"], list(ONE_LETTER))
+    link = polymer & np.isin(atoms["name"], LINK_ATOMS)
+    # Consecutive in the file and by number (insertion codes keep the number)
+    consecutive = (np.abs(residues[first] - residues[second]) == 1) & (np.abs(atoms["resi"][first] - atoms["resi"][second]) <= 1)
+    bonded = (residues[first] == residues[second]) | (
+        link[first] & link[second] & consecutive & (atoms["chain"][first] == atoms["chain"][second]))
+    altloc_first, altloc_second = atoms["altloc"][first], atoms["altloc"][second]
+    other_conformer = (altloc_first != "") & (altloc_second != "") & (altloc_first != altloc_second)
+    keep = ~bonded & ~other_conformer
+
+    order = np.argsort(distances[keep], kind="stable")
+    return pairs[keep][order], distances[keep][order]
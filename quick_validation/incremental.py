@@ -0,0 +1,99 @@
+"""Per residue fingerprints of a model, so that only residues changed since the last run are checked again"""
+import json
+import os
+import numpy as np
+
+from structure_io import residue_starts
+
+STATE_SUFFIX = ".qvstate.npz"
+
+# 64 bit FNV-1a constants, numpy uint64 arithmetic wraps around
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def _atom_hashes(atoms):
+    """Hash of name, altloc, element, residue name, coordinates (mA) and occupancy of every atom"""
+    # Unicode fields are hashed as they are, encoding them would cost more than the hash
+    record = np.zeros(len(atoms["chain"]), dtype=[("name", "U4"), ("altloc", "U1"), ("element", "U2"), ("resn", "U4"),
+                                                  ("xyz", "<i4", 3), ("occupancy", "<i4"), ("padding", "<i4")])
+    for column in ["name", "altloc", "element", "resn"]:
+        record[column] = atoms[column]
+    record["xyz"] = np.round(np.column_stack([atoms["x"], atoms["y"], atoms["z"]]) * 1000)
+    record["occupancy"] = np.round(atoms["occupancy"] * 100)
+
+    return _fnv(record)
+
+
+def _fnv(record):
+    """FNV-1a over the 8 byte words of every row of a structured array (row size a multiple of 8)"""
+    hashes = np.full(len(record), FNV_OFFSET)
+    for word in record.view(np.uint64).reshape(len(record), -1).T:
+        hashes = (hashes ^ word) * FNV_PRIME
+    return hashes
+
+
+def residue_fingerprints(atoms):
+    """Key (hash of chain, number and insertion code) and fingerprint of every residue, plus the residue of every atom
+
+    The fingerprint covers the atoms of the residue and of its neighbours in the
+    chain, so inserting or deleting a residue also marks the residues around it
+    (their peptide bond exclusions change).
+    """
+    starts = residue_starts(atoms)
+    counts = np.diff(np.append(starts, len(atoms["chain"])))
+    residues = np.repeat(np.arange(len(starts)), counts)
+
+    # Atom order within the residue matters
+    position = (np.arange(len(residues)) - starts[residues]).astype(np.uint64)
+    own = np.add.reduceat(_atom_hashes(atoms) ^ (position * FNV_PRIME), starts) if len(starts) else np.empty(0, np.uint64)
+
+    chains = atoms["chain"][starts]
+    same_chain = chains[1:] == chains[:-1]
+    previous = np.zeros_like(own)
+    following = np.zeros_like(own)
+    previous[1:] = np.where(same_chain, own[:-1], 0)
+    following[:-1] = np.where(same_chain, own[1:], 0)
+    fingerprints = own + previous * np.uint64(3) + following * np.uint64(5)
+
+    key_record = np.zeros(len(starts), dtype=[("chain", "U4"), ("icode", "U2"), ("resi", "<i8")])
+    key_record["chain"] = chains
+    key_record["icode"] = atoms["icode"][starts]
+    key_record["resi"] = atoms["resi"][starts]
+    return _fnv(key_record), fingerprints, residues
+
+
+def changed_residues(keys, fingerprints, state):
+    """Residues that are new or differ from the previous run"""
+    old_keys, old_fingerprints = state["keys"], state["fingerprints"]
+    if not len(old_keys):
+        return np.ones(len(keys), dtype=bool)
+    order = np.argsort(old_keys)
+    position = np.searchsorted(old_keys[order], keys).clip(max=len(old_keys) - 1)
+    found = old_keys[order][position] == keys
+    return ~found | (old_fingerprints[order][position] != fingerprints)
+
+
+def state_file(model_file):
+    return str(model_file) + STATE_SUFFIX
+
+
+def load_state(model_file):
+    """Fingerprints and results of the previous run, None if there is none"""
+    try:
+        with np.load(state_file(model_file)) as state:
+            return {"keys": state["keys"], "fingerprints": state["fingerprints"],
+                    **json.loads(str(state["results"]))}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_state(model_file, keys, fingerprints, results):
+    """Store fingerprints and the json serializable results next to the model"""
+    tmp_file = f"{state_file(model_file)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as out_file:
+            np.savez(out_file, keys=keys, fingerprints=fingerprints, results=np.array(json.dumps(results)))
+        os.replace(tmp_file, state_file(model_file))
+    except OSError:
+        pass  # e.g. read-only directory, the next run is a full run
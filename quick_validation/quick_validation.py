@@ -1,74 +1,75 @@
 #!/usr/bin/env python
 """Quick validation of Protein structure Model before submitting to PDB"""
 from Bio.Align import PairwiseAligner
+import numpy as np
+import functools
 import subprocess
 import logging
 import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from phenix_stats import model_statistics
+from structure_io import read_structure, chain_sequences
+from contacts import polar_contacts, atom_labels
+from reference_db import ReferenceDB
+from incremental import residue_fingerprints, changed_residues, load_state, save_state
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
 
 def get_fasta_sequence(fasta_file):
-    """Get the sequence from the fasta file"""
+    """Get the (first) sequence from the fasta file"""
+    return ReferenceDB(fasta_file).sequence(0)
 
-    # Open the file
-    with open(fasta_file, "r") as f:
-        # Read the file
-        lines = f.readlines()
+def get_pdb_sequence(model_file, atoms=None):
+    """Get model sequence of every chain from the PDB/mmCIF file (or the atoms already read from it)"""
+    model_name = os.path.splitext(os.path.basename(model_file))[0]
+    sequences = chain_sequences(read_structure(model_file) if atoms is None else atoms)
 
-    # Get the sequence
-    sequence = lines[1].strip()
+    return {f">{model_name}_{chain}": sequence for chain, sequence in sequences.items()}
 
-    return sequence
 
-def get_pdb_sequence(model_file):
-    """Get model sequence from PDB file"""
+@functools.lru_cache(maxsize=1024)
+def align_chain(reference_sequence, model_sequence, scoring=None):
+    """Mismatch positions (alignment columns, gaps ignored) and best alignment of one chain
 
-    pymol_get_seq = f"cmd.load('{model_file}');print('XXXXXXXX') ;print(cmd.get_fastastr('all'))"
-    
-    result = subprocess.run(["pymol", "-c", "-q", "-d", pymol_get_seq], capture_output=True)
-    result = result.stdout.decode("utf-8").split("\n")
-    index = result.index("XXXXXXXX")
+    scoring is a tuple of (PairwiseAligner attribute, value) pairs, None uses the
+    defaults. Chains that are an exact part of the reference are not aligned at all.
+    Results are cached by (reference, chain sequence, scoring), so identical chains
+    are only aligned once.
+    """
+    if model_sequence in reference_sequence:
+        return [], None
 
-    sequences = {}
-    for i in range(index+1, len(result)):
-        if result[i].startswith(">"):
-            seq_name = result[i]
-            sequences[seq_name] = ""
-        else:
-            sequences[seq_name] += result[i]
+    aligner = PairwiseAligner(**dict(scoring or ()))
+    best_alignment = aligner.align(reference_sequence, model_sequence)[0]
 
-    return sequences
+    ref_alignment = np.frombuffer(best_alignment[0].encode(), dtype="S1")
+    model_alignment = np.frombuffer(best_alignment[1].encode(), dtype="S1")
+    mismatches = np.flatnonzero((ref_alignment != model_alignment) & (model_alignment != b"-")).tolist()
 
+    return mismatches, best_alignment
 
 
-def check_sequence(reference_sequence, model_sequences):
+def check_sequence(reference_sequence, model_sequences, scoring=None):
     """Align Reference Sequence with Model Sequence and check for any mismatches"""
-
-    # Create a PairwiseAligner object
-    aligner = PairwiseAligner()
     errors = []
 
-    # Perform alignment
+    # Identical chains (homo-oligomers) are aligned once
+    chains_by_sequence = {}
     for model_name, model_sequence in model_sequences.items():
+        chains_by_sequence.setdefault(model_sequence, []).append(model_name)
 
-        alignments = aligner.align(reference_sequence, model_sequence)
-
-        # Get the best alignment (first one in the list)
-        best_alignment = alignments[0]
-
-
-        ref_alignment = best_alignment[0]
-        model_alignment = best_alignment[1]
-
-        # Check for mismatches, ignoring gaps
-        mismatches = [i for i in range(len(ref_alignment)) 
-                      if ref_alignment[i] != model_alignment[i]  
-                      and model_alignment[i] != '-']
-
+    for model_sequence, model_names in chains_by_sequence.items():
+        mismatches, best_alignment = align_chain(reference_sequence, model_sequence, scoring)
         if mismatches:
-            errors.append((model_name, mismatches, best_alignment))
-
+            errors.extend((model_name, mismatches, best_alignment) for model_name in model_names)
 
     if errors:
         logging.error("Mismatches found in the following models:")
@@ -79,74 +80,356 @@ def check_sequence(reference_sequence, model_sequences):
     else:
         logging.info("No mismatches found")
 
-def close_contacts(model_file, cutoff=2.2):
-    """Check if there are any close contacts in the model"""
-    pymol_command = f"cmd.load('{model_file}'); print(cmd.distance('tmp', 'all and not inorganic', 'all and not inorganic', mode=2, cutoff={cutoff}))"
-    result = subprocess.run(["pymol", "-c", "-q", "-d", pymol_command], check=True, capture_output=True, text=True)
-    result = float(result.stdout.splitlines()[-1])
-    
-    if result > 0:
-        logging.error(f"Polar contacts closer or equal to {cutoff} A found in the model.")
+    return errors
+
+def best_reference(reference_db, model_sequence, scoring=None, top=5):
+    """Index of the library entry matching the chain best (k-mer prefilter, then alignment)"""
+    best, best_score = None, None
+    if len(model_sequence) < reference_db.k:
+        # Chains shorter than a k-mer (e.g. bound peptides) have no k-mers, align them against every entry
+        entries = range(len(reference_db))
     else:
-        logging.info(f"No polar contacts closer or equal to {cutoff} A found in the model.")
+        entries = reference_db.candidates(model_sequence, top=top)
+    for entry in entries:
+        mismatches, alignment = align_chain(reference_db.sequence(entry), model_sequence, scoring)
+        if alignment is None:
+            return entry  # exact part of this reference
+        if best_score is None or alignment.score > best_score:
+            best, best_score = entry, alignment.score
+    return best
+
+
+def check_sequence_library(reference_db, model_sequences, scoring=None):
+    """Match every chain to its best reference of a multi-FASTA library and check for mismatches
+
+    Returns the mismatch errors and the name of the matched reference per chain
+    (None if no reference shares a k-mer with the chain).
+    """
+    matches = {}
+    chains_by_reference = {}
+    for model_name, model_sequence in model_sequences.items():
+        entry = best_reference(reference_db, model_sequence, scoring)
+        matches[model_name] = None if entry is None else str(reference_db.names[entry])
+        if entry is None:
+            logging.error(f"No reference sequence found for {model_name}")
+        else:
+            logging.info(f"{model_name} matches reference {matches[model_name]}")
+            chains_by_reference.setdefault(entry, {})[model_name] = model_sequence
 
-def molprobity(model_file, cif_files=None):
-    """Run MolProbity validation"""
-    if cif_files:
-        cif_str = " ".join(str(cif) for cif in cif_files)
-        ref_stats_command = f"phenix.model_statistics {model_file} {cif_str}".split()
+    errors = []
+    for entry, chains in chains_by_reference.items():
+        errors.extend(check_sequence(reference_db.sequence(entry), chains, scoring))
+    return errors, matches
+
+def check_references(references, model_sequences, scoring=None):
+    """check_sequence for a single reference, check_sequence_library for a multi-FASTA library
+
+    Returns the errors and the matched reference of every chain.
+    """
+    if len(references) == 1:
+        errors = check_sequence(references.sequence(0), model_sequences, scoring)
+        return errors, {model_name: str(references.names[0]) for model_name in model_sequences}
+    return check_sequence_library(references, model_sequences, scoring)
+
+def _log_contacts(contacts, cutoff):
+    """Log the close contacts (first label, second label, distance, ...)"""
+    if contacts:
+        logging.error(f"{len(contacts)} polar contacts closer or equal to {cutoff} A found in the model:")
+        for first, second, distance, *_ in contacts:
+            logging.info(f"{first} - {second}: {distance:.2f} A")
     else:
-        ref_stats_command = f"phenix.model_statistics {model_file}".split()
-    
+        logging.info(f"No polar contacts closer or equal to {cutoff} A found in the model.")
+
+def _contact_list(atoms, cutoff, query=None):
+    """Close polar contacts as (label1, label2, distance) and the atom index pairs"""
+    pairs, distances = polar_contacts(atoms, cutoff=cutoff, query=query)
+    contacts = [(first, second, float(distance)) for (first, second), distance
+                in zip(zip(atom_labels(atoms, pairs[:, 0]), atom_labels(atoms, pairs[:, 1])), distances)]
+    return contacts, pairs
+
+def close_contacts(model_file, cutoff=2.2, atoms=None):
+    """Check if there are any close polar contacts in the model, returns the atom pairs"""
+    contacts, _ = _contact_list(read_structure(model_file) if atoms is None else atoms, cutoff)
+    _log_contacts(contacts, cutoff)
+    return contacts
+
+def incremental_close_contacts(atoms, cutoff, keys, residues, changed, previous):
+    """Close contacts of the changed residues merged with the previous contacts of unchanged residues
+
+    Contacts are (label1, label2, distance, residue key1, residue key2). Only pairs
+    with at least one atom of a changed residue are searched, which also finds
+    their new spatial neighbours. Previous contacts are kept if both residues
+    are unchanged.
+    """
+    contacts = []
+    if changed.any():
+        # polar_contacts returns no pairs if the changed residues have no polar atoms (e.g. only an ion moved)
+        query = None if changed.all() else np.flatnonzero(changed[residues])
+        found, pairs = _contact_list(atoms, cutoff, query=query)
+        contacts = [contact + (int(keys[residues[first]]), int(keys[residues[second]]))
+                    for contact, (first, second) in zip(found, pairs)]
+    if previous:
+        unchanged = set(keys[~changed].tolist())
+        contacts += [tuple(contact) for contact in previous if contact[3] in unchanged and contact[4] in unchanged]
+    contacts.sort(key=lambda contact: contact[2])
+    _log_contacts(contacts, cutoff)
+    return contacts
+
+
+def molprobity(model_file, cif_files=None, use_cache=True):
+    """Run MolProbity validation, returns the statistics or None if phenix failed"""
     try:
-        ref_stats = subprocess.run(ref_stats_command, capture_output=True, text=True, check=True)
+        statistics = model_statistics(model_file, cif_files, use_cache=use_cache)
     except subprocess.CalledProcessError as e:
-        logging.error(f"Error running phenix.model_statistics. Did you include the cif files? Please check manually. Aborting.")
-        exit(1)
-    
-    for index, line in enumerate(ref_stats.stdout.splitlines()): # Get all parameters from output
-        if line.strip().startswith("Bond"):
-            line_list = line.strip().split()
-            logging.info(f"Bond RMSD: {line_list[2]}")
-        if line.strip().startswith("Angle"):
-            line_list = line.strip().split()
-            logging.info(f"Angle RMSD: {line_list[2]}")
-        if line.strip().startswith("Ramachandran Plot"):
-            outl_index = index + 1
-            allowed_index = index + 2
-            favored_index = index + 3
-
-            outl_list = ref_stats.stdout.splitlines()[outl_index].strip().split()
-            logging.info(f"Ramachandran Outliers: {float(outl_list[2])}")
-
-            allowed_list = ref_stats.stdout.splitlines()[allowed_index].strip().split()
-            logging.info(f"Ramachandran Allowed: {float(allowed_list[2])}")
-
-            favored_list = ref_stats.stdout.splitlines()[favored_index].strip().split()
-            logging.info(f"Ramachandran Favored: {float(favored_list[2])}")
-
-        if line.strip().startswith("Rotamer Outliers"):
-            line_list = line.strip().split()
-            logging.info(f"Rotamer Outliers: {float(line_list[3])}")
-        if line.strip().startswith("All-atom Clashscore"):
-            line_list = line.strip().split()
-            logging.info(f"All-atom Clashscore: {float(line_list[-1])}")
-        
-
-def main(reference_fasta, model, cif_files=None):
-
-    reference_sequence = get_fasta_sequence(reference_fasta)
-    model_sequence = get_pdb_sequence(model)
-    check_sequence(reference_sequence, model_sequence)
-    close_contacts(model, cutoff=2.2)
-    molprobity(model, cif_files=args.cif)
+        details = (e.stderr or "").strip().splitlines()[-5:]
+        logging.error(f"phenix.model_statistics failed with return code {e.returncode}, MolProbity was skipped. "
+                      f"Did you include the cif files? {' '.join(details)}")
+        return None
+
+    logging.info(f"Bond RMSD: {statistics['Bond RMSD']}")
+    logging.info(f"Angle RMSD: {statistics['Angle RMSD']}")
+    logging.info(f"Ramachandran Outliers: {statistics['Ramachandran']['Outliers']}")
+    logging.info(f"Ramachandran Allowed: {statistics['Ramachandran']['Allowed']}")
+    logging.info(f"Ramachandran Favored: {statistics['Ramachandran']['Favored']}")
+    logging.info(f"Rotamer Outliers: {statistics['Rotamer Outliers']}")
+    logging.info(f"All-atom Clashscore: {statistics['All-atom Clashscore']}")
+
+    return statistics
+
+
+CHECKS = ["sequence", "close_contacts", "molprobity"]
+
+
+def _timed(check, *args, **kwargs):
+    """Run one check, returns its result and the wall-clock time"""
+    start = time.perf_counter()
+    result = check(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _submit(executor, futures, name, check):
+    """Start a check (returns its report entry) in the thread pool"""
+    futures[executor.submit(_timed, check)] = name
+
+
+def _collect(futures):
+    """Report entries of the submitted checks, each result is logged as soon as its check is done"""
+    results = {}
+    for future in as_completed(futures):
+        name = futures[future]
+        result, seconds = future.result()
+        result["seconds"] = seconds
+        results[name] = result
+        logging.info(f"{name}: {'PASS' if result['passed'] else 'FAIL'} ({seconds:.2f} s)")
+    return {name: results[name] for name in CHECKS if name in results}
+
+
+def _molprobity_check(model, cif_files, use_cache):
+    """Report entry of the MolProbity check"""
+    statistics = molprobity(model, cif_files=cif_files, use_cache=use_cache)
+    return {"passed": statistics is not None, "statistics": statistics}
+
+
+def summary(report):
+    """One line with pass/fail and time of every check"""
+    checks = ", ".join(f"{check} {'PASS' if result['passed'] else 'FAIL'} ({result['seconds']:.2f} s)"
+                       for check, result in report["checks"].items())
+    return f"{checks}, total {report['seconds']:.2f} s"
+
+
+def validate_model(reference_fasta, model, cif_files=None, use_cache=True, cutoff=2.2, incremental=False, fast=False):
+    """Run all checks on one model and return a report with pass/fail and timings per check
+
+    The checks run concurrently (MolProbity is an external process), so the wall
+    time is about that of the slowest check. fast=True skips MolProbity. With
+    incremental=True per residue fingerprints and results are kept next to the
+    model and only chains/residues changed since the last run are checked.
+    """
+    if incremental:
+        return validate_model_incremental(reference_fasta, model, cif_files, use_cache=use_cache, cutoff=cutoff, fast=fast)
+
+    start = time.perf_counter()
+    report = {"model": model, "reference": reference_fasta}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=len(CHECKS) + 1) as executor:
+        if not fast:
+            _submit(executor, futures, "molprobity", functools.partial(_molprobity_check, model, cif_files, use_cache))
+        # Both other checks need the atoms, the model is read once
+        atoms = executor.submit(read_structure, model)
+
+        def sequence_check():
+            errors, matches = check_references(ReferenceDB(reference_fasta), get_pdb_sequence(model, atoms.result()))
+            return {"passed": not errors and None not in matches.values(),
+                    "mismatches": {model_name: mismatches for model_name, mismatches, _ in errors},
+                    "references": matches}
+
+        def contacts_check():
+            contacts = close_contacts(model, cutoff=cutoff, atoms=atoms.result())
+            return {"passed": not contacts, "contacts": contacts}
+
+        _submit(executor, futures, "sequence", sequence_check)
+        _submit(executor, futures, "close_contacts", contacts_check)
+        report["checks"] = _collect(futures)
+
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def validate_model_incremental(reference_fasta, model, cif_files=None, use_cache=True, cutoff=2.2, fast=False):
+    """validate_model re-checking only what changed since the previous run of the model"""
+    start = time.perf_counter()
+    report = {"model": model, "reference": reference_fasta}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=len(CHECKS)) as executor:
+        if not fast:
+            _submit(executor, futures, "molprobity", functools.partial(_molprobity_check, model, cif_files, use_cache))
+
+        atoms = read_structure(model)
+        references = ReferenceDB(reference_fasta)
+        keys, fingerprints, residues = residue_fingerprints(atoms)
+        reference = [os.path.abspath(reference_fasta)] + references.signature.tolist()
+
+        state = load_state(model)
+        # Results of other settings or duplicated residue keys (no unique mapping) need a full run
+        if state is None or state["cutoff"] != cutoff or state["reference"] != reference or len(np.unique(keys)) != len(keys):
+            state = {"sequences": {}, "contacts": []}
+            changed = np.ones(len(keys), dtype=bool)
+        else:
+            changed = changed_residues(keys, fingerprints, state)
+        report["changed_residues"] = int(changed.sum())
+        logging.info(f"{report['changed_residues']} of {len(keys)} residues changed since the last run")
+        new_state = {"cutoff": cutoff, "reference": reference}
+
+        def sequence_check():
+            model_sequence = get_pdb_sequence(model, atoms)
+            previous = state["sequences"]
+            changed_chains = {model_name: sequence for model_name, sequence in model_sequence.items()
+                              if previous.get(model_name, {}).get("sequence") != sequence}
+            errors, matches = check_references(references, changed_chains) if changed_chains else ([], {})
+            mismatches = {model_name: chain_mismatches for model_name, chain_mismatches, _ in errors}
+            sequences = {}
+            for model_name, sequence in model_sequence.items():
+                if model_name in changed_chains:
+                    sequences[model_name] = {"sequence": sequence, "mismatches": mismatches.get(model_name, []),
+                                             "reference": matches[model_name]}
+                else:
+                    sequences[model_name] = previous[model_name]
+                    if sequences[model_name]["mismatches"]:
+                        logging.error(f"Mismatches in {model_name} (unchanged) at positions: {sequences[model_name]['mismatches']}")
+            new_state["sequences"] = sequences
+            return {"passed": all(chain["reference"] is not None and not chain["mismatches"] for chain in sequences.values()),
+                    "mismatches": {model_name: chain["mismatches"] for model_name, chain in sequences.items() if chain["mismatches"]},
+                    "references": {model_name: chain["reference"] for model_name, chain in sequences.items()},
+                    "rechecked": list(changed_chains)}
+
+        def contacts_check():
+            contacts = incremental_close_contacts(atoms, cutoff, keys, residues, changed, state["contacts"])
+            new_state["contacts"] = contacts
+            return {"passed": not contacts, "contacts": [contact[:3] for contact in contacts]}
+
+        _submit(executor, futures, "sequence", sequence_check)
+        _submit(executor, futures, "close_contacts", contacts_check)
+        report["checks"] = _collect(futures)
+
+    save_state(model, keys, fingerprints, new_state)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def read_manifest(manifest_file):
+    """Read batch manifest (csv with columns reference, model, cif), cif files separated by spaces"""
+    entries = []
+    with open(manifest_file, "r", newline="") as manifest:
+        for row in csv.DictReader(manifest):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            entries.append({"reference_fasta": row["reference"], "model": row["model"],
+                            "cif_files": row.get("cif", "").split() or None})
+    return entries
+
+
+def _validate_entry(entry, use_cache, cutoff, fast):
+    """Worker of validate_batch, a failing model becomes a failed report instead of an exception"""
+    try:
+        return validate_model(entry["reference_fasta"], entry["model"], entry["cif_files"], use_cache=use_cache, cutoff=cutoff, fast=fast)
+    except Exception as e:
+        return {"model": entry["model"], "reference": entry["reference_fasta"], "checks": {}, "error": str(e), "seconds": None}
+
+
+def validate_batch(entries, max_workers=None, use_cache=True, cutoff=2.2, fast=False):
+    """Validate many models in a process pool, reports are returned in manifest order"""
+    reports = {}
+    # The per check logging of the workers would interleave, only summaries are printed
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=logging.disable, initargs=(logging.CRITICAL,)) as executor:
+        future_to_index = {executor.submit(_validate_entry, entry, use_cache, cutoff, fast): index for index, entry in enumerate(entries)}
+        for future in as_completed(future_to_index):
+            report = future.result()
+            reports[future_to_index[future]] = report
+            if "error" in report:
+                logging.error(f"{report['model']}: {report['error']}")
+            else:
+                logging.info(f"{report['model']}: {summary(report)}")
+    return [reports[index] for index in range(len(entries))]
+
+
+def write_report(reports, report_file):
+    """Write the reports as json, or as one csv line per model if the file ends with .csv"""
+    if not report_file.lower().endswith(".csv"):
+        with open(report_file, "w") as out_file:
+            json.dump(reports, out_file, indent=2)
+        return
+
+    with open(report_file, "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(["model", "reference", "error"] + CHECKS + [f"seconds_{check}" for check in CHECKS] +
+                        ["seconds_total", "mismatched_chains", "close_contacts_count",
+                         "bond_rmsd", "angle_rmsd", "ramachandran_outliers", "rotamer_outliers", "clashscore"])
+        for report in reports:
+            results = report["checks"]
+            statistics = results.get("molprobity", {}).get("statistics") or {}
+            writer.writerow([report["model"], report["reference"], report.get("error", "")] +
+                            [results[check]["passed"] if check in results else "" for check in CHECKS] +
+                            [f"{results[check]['seconds']:.3f}" if check in results else "" for check in CHECKS] +
+                            [f"{report['seconds']:.3f}" if report["seconds"] is not None else "",
+                             " ".join(results.get("sequence", {}).get("mismatches", {})),
+                             len(results.get("close_contacts", {}).get("contacts", [])),
+                             statistics.get("Bond RMSD"), statistics.get("Angle RMSD"),
+                             (statistics.get("Ramachandran") or {}).get("Outliers"),
+                             statistics.get("Rotamer Outliers"), statistics.get("All-atom Clashscore")])
+
+
+def main(reference_fasta, model, cif_files=None, use_cache=True, cutoff=2.2, incremental=False, fast=False):
+
+    report = validate_model(reference_fasta, model, cif_files, use_cache=use_cache, cutoff=cutoff, incremental=incremental, fast=fast)
+    logging.info(f"Summary: {summary(report)}")
+    return report
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("reference", help="Reference sequence in fasta format")
-    parser.add_argument("model", help="Model file in PDB format")
+    parser.add_argument("reference", help="Reference sequence(s) in fasta format, chains are matched to the best entry of a multi-FASTA file", nargs="?")
+    parser.add_argument("model", help="Model file in PDB or mmCIF format", nargs="?")
     parser.add_argument("-c", "--cif", help="CIF files from refinement", required=False, nargs="+")
+    parser.add_argument("--no-cache", help="Always rerun phenix.model_statistics", action="store_true")
+    parser.add_argument("--cutoff", help="Distance cutoff for close polar contacts in A", type=float, default=2.2)
+    parser.add_argument("--fast", help="Skip MolProbity (phenix.model_statistics)", action="store_true")
+    parser.add_argument("-i", "--incremental", help="Only re-check residues changed since the last run (state kept next to the model)", action="store_true")
+    # Batch mode: manifest with one model per line, results collected in one report
+    parser.add_argument("-b", "--batch", help="Manifest csv (reference,model,cif) to validate many models in parallel", required=False)
+    parser.add_argument("-j", "--jobs", help="Number of parallel processes in batch mode", type=int, required=False)
+    parser.add_argument("-r", "--report", help="Write a json (or .csv) report", required=False)
     args = parser.parse_args()
 
-    main(args.reference, args.model, args.cif)
\ No newline at end of file
+    if args.batch:
+        reports = validate_batch(read_manifest(args.batch), max_workers=args.jobs, use_cache=not args.no_cache, cutoff=args.cutoff,
+                                 fast=args.fast)
+    elif args.reference and args.model:
+        reports = [main(args.reference, args.model, args.cif, use_cache=not args.no_cache, cutoff=args.cutoff,
+                        incremental=args.incremental, fast=args.fast)]
+    else:
+        parser.error("reference and model are required without --batch")
+
+    if args.report:
+        write_report(reports, args.report)
+    # Exit code after the report is written so that failed models are in it
+    if not args.batch and not reports[0]["checks"].get("molprobity", {"passed": True})["passed"]:
+        exit(1)
@@ -0,0 +1,114 @@
+"""Multi-FASTA reference library with an on-disk offset index and a k-mer prefilter"""
+import os
+import zipfile
+import numpy as np
+
+KMER = 5
+INDEX_SUFFIX = ".qvidx.npz"
+
+
+def kmer_codes(sequence, k=KMER):
+    """Sorted unique integer codes of all k-mers (5 bits per residue)"""
+    letters = np.frombuffer(sequence.upper().encode(), dtype=np.uint8) & 31
+    if len(letters) < k:
+        return np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(letters, k).astype(np.int64)
+    return np.unique((windows << (5 * np.arange(k - 1, -1, -1))).sum(axis=1))
+
+
+class ReferenceDB:
+    """Sequences of a (multi-)FASTA file, read on demand through a byte offset index
+
+    The index (names, byte ranges and a sorted k-mer table) is stored next to
+    the FASTA file and rebuilt when the file changes. Single sequence files are
+    not indexed on disk.
+    """
+
+    def __init__(self, fasta_file, k=KMER):
+        self.fasta_file = fasta_file
+        self.k = k
+        self.index_file = fasta_file + INDEX_SUFFIX
+        stat = os.stat(fasta_file)
+        self.signature = np.array([stat.st_size, stat.st_mtime_ns, k], dtype=np.int64)
+        if not self._load_index():
+            self._build_index()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _load_index(self):
+        """Use the stored index if it belongs to the current FASTA file"""
+        try:
+            with np.load(self.index_file) as index:
+                if not np.array_equal(index["signature"], self.signature):
+                    return False
+                self.names = index["names"]
+                self.ranges = index["ranges"]
+                self.codes = index["codes"]
+                self.entries = index["entries"]
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return False  # missing, truncated or stale index, rebuilt
+        return True
+
+    def _build_index(self):
+        """Read the FASTA file once, keep byte ranges and k-mers of every sequence"""
+        names, ranges, codes, entries = [], [], [], []
+
+        def add_entry(start, end, lines):
+            entry_codes = kmer_codes("".join(lines), self.k)
+            ranges.append((start, end))
+            codes.append(entry_codes)
+            entries.append(np.full(len(entry_codes), len(names) - 1, dtype=np.int32))
+
+        with open(self.fasta_file, "rb") as fasta:
+            start = None
+            lines = []
+            offset = 0
+            for line in fasta:
+                if line.startswith(b">"):
+                    if start is not None:
+                        add_entry(start, offset, lines)
+                    names.append(line[1:].split()[0].decode() if line[1:].split() else f"sequence_{len(names) + 1}")
+                    start = offset + len(line)
+                    lines = []
+                else:
+                    lines.append(line.strip().decode())
+                offset += len(line)
+            if start is not None:
+                add_entry(start, offset, lines)
+
+        self.names = np.array(names, dtype=str)
+        self.ranges = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+        codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+        entries = np.concatenate(entries) if entries else np.empty(0, dtype=np.int32)
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.entries = entries[order]
+
+        if len(names) > 1:
+            # Written to a temporary file first, parallel batch workers never read a partial index
+            tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_file, "wb") as index:
+                    np.savez(index, signature=self.signature, names=self.names, ranges=self.ranges,
+                             codes=self.codes, entries=self.entries)
+                os.replace(tmp_file, self.index_file)
+            except OSError:
+                pass  # e.g. read-only library, the index is just not kept
+
+    def sequence(self, index):
+        """Sequence of entry index, read from its byte range"""
+        start, end = self.ranges[index]
+        with open(self.fasta_file, "rb") as fasta:
+            fasta.seek(start)
+            return "".join(fasta.read(end - start).decode().split())
+
+    def candidates(self, sequence, top=5):
+        """Entries sharing the most k-mers with sequence, best first (entries without shared k-mers are dropped)"""
+        query = kmer_codes(sequence, self.k)
+        starts = np.searchsorted(self.codes, query, side="left")
+        counts = np.searchsorted(self.codes, query, side="right") - starts
+        hits = self.entries[np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+        shared = np.bincount(hits, minlength=len(self.names))
+        best = np.argsort(-shared, kind="stable")[:top]
+        return [int(entry) for entry in best if shared[entry] > 0]
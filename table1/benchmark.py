@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""Benchmark the table1 stages on synthetic CORRECT.LP/PDB files with a stub phenix (runs offline)"""
+import argparse
+import json
+import os
+import resource
+import stat
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from table1 import Table1
+
+STUB_OUTPUT = """Geometry Restraints Library: GeoStd + Monomer Library + CDL v1.2
+Deviations from Ideal Values.
+  Bond      :  0.004   0.043   2345
+  Angle     :  0.653   4.526   3187
+  Chirality :  0.043   0.140    356
+  Planarity :  0.004   0.030    413
+  Dihedral  : 13.542  86.917    868
+  Min Nonbonded Distance : 2.512
+
+Molprobity Statistics.
+  All-atom Clashscore : 3.12
+  Ramachandran Plot:
+    Outliers :  0.10 %
+    Allowed  :  2.10 %
+    Favored  : 97.80 %
+  Rotamer Outliers :  0.40 %
+  Cbeta Deviations :  0.00 %
+
+ADP (B-factors)
+  Overall:   2345  0  30.45  80.12
+  Protein:   2200  0  29.10  70.00
+  Water:      145  0  35.20  60.00
+"""
+
+SHELL_HEADER = """ SUBSET OF INTENSITY DATA WITH SIGNAL/NOISE >= -3.0 AS FUNCTION OF RESOLUTION
+ RESOLUTION     NUMBER OF REFLECTIONS    COMPLETENESS R-FACTOR  R-FACTOR COMPARED I/SIGMA   R-meas  CC(1/2)  Anomal  SigAno   Nano
+   LIMIT     OBSERVED  UNIQUE  POSSIBLE     OF DATA   observed  expected                                      Corr
+
+"""
+
+RESIDUES = ["ALA", "ARG", "ASN", "ASP", "CYS", "GLN", "GLU", "GLY", "HIS", "ILE",
+            "LEU", "LYS", "MET", "PHE", "PRO", "SER", "THR", "TRP", "TYR", "VAL"]
+BACKBONE = [(" N  ", "N"), (" CA ", "C"), (" C  ", "C"), (" O  ", "O"), (" CB ", "C")]
+
+
+def write_stub_executables(bin_dir, delay=0.0):
+    """Write a phenix.model_statistics stub printing fixed statistics"""
+    stub = os.path.join(bin_dir, "phenix.model_statistics")
+    with open(stub, "w") as out_file:
+        out_file.write(f"#!{sys.executable}\nimport time\ntime.sleep({delay})\nprint({STUB_OUTPUT!r})\n")
+    os.chmod(stub, os.stat(stub).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _shell_table(shells, out_file):
+    """Write one resolution shell table including the total line"""
+    out_file.write(SHELL_HEADER)
+    for i in range(shells):
+        resolution = 1.5 + 4.0 * (shells - i) / shells
+        out_file.write(f"{resolution:9.2f}{9500 + i:12d}{1550:8d}{1560:10d}{99.4:11.1f}%{3.1 + i:10.1f}%{3.3 + i:9.1f}%"
+                       f"{9490:9d}{41.01 - i * 0.5:8.2f}{3.4 + i:10.1f}%{99.9 - i * 0.1:8.1f}*{11:6d}{0.901:9.3f}{1250:8d}\n")
+    out_file.write(f"    total{9500 * shells:12d}{1550 * shells:8d}{1560 * shells:10d}{99.4:11.1f}%{6.0:10.1f}%{6.2:9.1f}%"
+                   f"{9490 * shells:9d}{18.03:8.2f}{6.5:10.1f}%{99.8:8.1f}*{6:6d}{0.801:9.3f}{1250 * shells:8d}\n\n")
+
+
+def write_correct_lp(file_name, shells=10, sweeps=1, images=100):
+    """Synthetic CORRECT.LP with per image tables for every sweep and a final shell table"""
+    with open(file_name, "w") as out_file:
+        out_file.write(" X-RAY_WAVELENGTH=  0.976250\n SPACE_GROUP_NUMBER=   19\n"
+                       " UNIT_CELL_CONSTANTS=    50.12    60.34    70.56  90.000  90.000  90.000\n"
+                       " INCLUDE_RESOLUTION_RANGE=  48.00   1.50\n\n")
+        for sweep in range(sweeps):
+            out_file.write(f" DATA_RANGE= {sweep * images + 1} {(sweep + 1) * images}\n"
+                           "  IMAGE IER  SCALE     NBKG NOVL NEWALD NSTRONG  NREJ   SIGMAB   SIGMAR\n")
+            for image in range(sweep * images + 1, (sweep + 1) * images + 1):
+                out_file.write(f"{image:7d}   0  1.000  1234567    0   1234    123     0  0.01234  0.08765\n")
+            out_file.write("\n")
+            _shell_table(shells, out_file)
+        out_file.write(' STATISTICS OF SAVED DATA SET "XDS_ASCII.HKL" (DATA_RANGE=       1    3600)\n\n')
+        _shell_table(shells, out_file)
+        out_file.write(" WILSON LINE (using all data) : A=  -2.123 B=  25.432 CORRELATION=  0.99\n")
+
+
+def write_pdb(file_name, atoms=1000, ligand="LIG"):
+    """Synthetic PDB with a REMARK 3 header, protein chains, ligands and waters"""
+    with open(file_name, "w") as out_file:
+        out_file.write("REMARK   3   RESOLUTION RANGE HIGH (ANGSTROMS) : 1.50\n"
+                       "REMARK   3   RESOLUTION RANGE LOW  (ANGSTROMS) : 48.00\n"
+                       "REMARK   3   R VALUE            (WORKING SET) : 0.180\n"
+                       "REMARK   3   FREE R VALUE                     : 0.220\n")
+        lines = []
+        for serial in range(1, atoms + 1):
+            residue = (serial - 1) // len(BACKBONE)
+            chain = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[residue // 9999 % 26]
+            resi = residue % 9999 + 1
+            name, element = BACKBONE[(serial - 1) % len(BACKBONE)]
+            if serial % 100 == 0:
+                record, resn, name, element = "HETATM", ligand, " C1 ", "C"
+            elif serial % 50 == 0:
+                record, resn, name, element = "HETATM", "HOH", " O  ", "O"
+            else:
+                record, resn = "ATOM  ", RESIDUES[residue % len(RESIDUES)]
+            lines.append(f"{record}{serial % 100000:5d} {name} {resn} {chain}{resi:4d}    "
+                         f"{serial % 997 * 0.1:8.3f}{serial % 991 * 0.1:8.3f}{serial % 983 * 0.1:8.3f}"
+                         f"  1.00{20 + serial % 40:6.2f}          {element:>2}\n")
+            if len(lines) == 100000:
+                out_file.writelines(lines)
+                lines = []
+        out_file.writelines(lines)
+        out_file.write("END\n")
+
+
+def _measure_stage(table1_kwargs, stage):
+    """Wall-clock time and peak RSS increase of one stage (runs in a fresh process)"""
+    table1 = Table1(**table1_kwargs)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    getattr(table1, stage)()
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return seconds, peak * 1024  # ru_maxrss is in KiB on Linux
+
+
+def measure(table1_kwargs, stage, repeats=3):
+    """Best time and largest peak memory of repeated runs, each in its own process"""
+    runs = []
+    for _ in range(repeats):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            runs.append(executor.submit(_measure_stage, table1_kwargs, stage).result())
+    return min(seconds for seconds, _ in runs), max(peak for _, peak in runs)
+
+
+def run_benchmark(work_dir, correct_sizes, atom_counts, shells=20, repeats=3, stub_delay=0.0):
+    """Time get_data_collection, get_refinement and get_b_factor on all fixture sizes"""
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    write_stub_executables(bin_dir, delay=stub_delay)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+
+    results = []
+    for sweeps, images in correct_sizes:
+        correct = os.path.join(work_dir, f"CORRECT_{sweeps}x{images}.LP")
+        write_correct_lp(correct, shells=shells, sweeps=sweeps, images=images)
+        size = os.path.getsize(correct)
+        seconds, peak = measure({"xds_correct": correct}, "get_data_collection", repeats)
+        results.append({"stage": "get_data_collection", "input": f"{sweeps} sweeps x {images} images",
+                        "bytes": size, "seconds": seconds, "peak_memory": peak,
+                        "throughput": f"{size / seconds / 1e6:.1f} MB/s"})
+
+    for atoms in atom_counts:
+        pdb_file = os.path.join(work_dir, f"model_{atoms}.pdb")
+        write_pdb(pdb_file, atoms=atoms)
+        table1_kwargs = {"pdb_file": pdb_file, "ligand_name": "LIG", "use_cache": False}
+        for stage in ["get_refinement", "get_b_factor"]:
+            seconds, peak = measure(table1_kwargs, stage, repeats)
+            results.append({"stage": stage, "input": f"{atoms} atoms", "bytes": os.path.getsize(pdb_file),
+                            "seconds": seconds, "peak_memory": peak,
+                            "throughput": f"{atoms / seconds / 1e6:.2f} Matoms/s"})
+    return results
+
+
+def print_results(results):
+    """Print the benchmark results as a table"""
+    print(f"{'stage':<20} {'input':<28} {'size (MB)':>10} {'time (s)':>10} {'peak (MB)':>10}  throughput")
+    for result in results:
+        print(f"{result['stage']:<20} {result['input']:<28} {result['bytes'] / 1e6:10.2f} {result['seconds']:10.4f} "
+              f"{result['peak_memory'] / 1e6:10.2f}  {result['throughput']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sweeps", help="Number of sweeps of the synthetic CORRECT.LP files", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--images", help="Images per sweep", type=int, default=3600)
+    parser.add_argument("--shells", help="Resolution shells per table", type=int, default=20)
+    parser.add_argument("--atoms", help="Atom counts of the synthetic models", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--repeats", help="Best of this many runs is reported", type=int, default=3)
+    parser.add_argument("--stub-delay", help="Seconds the phenix stub sleeps", type=float, default=0.0)
+    parser.add_argument("--json", help="Also write the results to a json file (e.g. to compare runs)", required=False)
+    parser.add_argument("--keep", help="Keep the generated files in this directory", required=False)
+    args = parser.parse_args()
+
+    correct_sizes = [(sweeps, args.images) for sweeps in args.sweeps]
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        results = run_benchmark(args.keep, correct_sizes, args.atoms, shells=args.shells,
+                                repeats=args.repeats, stub_delay=args.stub_delay)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmark(work_dir, correct_sizes, args.atoms, shells=args.shells,
+                                    repeats=args.repeats, stub_delay=args.stub_delay)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,106 @@
+"""Single pass parser for XDS CORRECT.LP files"""
+import numpy as np
+
+# One row of the resolution shell table of the saved data set
+SHELL_DTYPE = np.dtype([("resolution", "f8"),
+                        ("observed", "i8"),
+                        ("unique", "i8"),
+                        ("possible", "i8"),
+                        ("completeness", "f8"),
+                        ("r_observed", "f8"),
+                        ("r_expected", "f8"),
+                        ("compared", "i8"),
+                        ("i_sigma", "f8"),
+                        ("r_meas", "f8"),
+                        ("cc_half", "f8"),
+                        ("cc_half_significant", "?"),
+                        ("anomal_corr", "f8"),
+                        ("sig_ano", "f8"),
+                        ("n_ano", "i8")])
+
+SAVED_DATA_SET = 'STATISTICS OF SAVED DATA SET "XDS_ASCII.HKL"'
+
+# Parser states
+HEADER, SAVED, DONE = range(3)
+
+
+def _number(token, integer=False):
+    """Convert a table token ("99.5%", "99.9*", "****") to a number"""
+    token = token.rstrip("%*")
+    try:
+        return int(token) if integer else float(token)
+    except ValueError:
+        return -1 if integer else np.nan
+
+
+def _shell_row(tokens, resolution):
+    """Convert the tokens of one shell line to a tuple matching SHELL_DTYPE"""
+    tokens = tokens + ["nan"] * (14 - len(tokens))
+    return (resolution,
+            _number(tokens[1], True),
+            _number(tokens[2], True),
+            _number(tokens[3], True),
+            _number(tokens[4]),
+            _number(tokens[5]),
+            _number(tokens[6]),
+            _number(tokens[7], True),
+            _number(tokens[8]),
+            _number(tokens[9]),
+            _number(tokens[10]),
+            tokens[10].endswith("*"),
+            _number(tokens[11]),
+            _number(tokens[12]),
+            _number(tokens[13], True))
+
+
+def parse_correct_lp(correct_file):
+    """Read a CORRECT.LP file once and return header values and the full shell table
+
+    Returns a dict with wavelength, space_group, cell (a, b, c, alpha, beta, gamma),
+    resolution_range (low, high), wilson_b, shells (structured array with one row per
+    resolution shell of the saved data set, SHELL_DTYPE) and total (the "total" row).
+    Keywords that occur more than once keep the last value, like XDS does.
+    """
+    result = {"wavelength": None, "space_group": None, "cell": None,
+              "resolution_range": None, "wilson_b": None,
+              "shells": np.empty(0, dtype=SHELL_DTYPE), "total": None}
+    shells = []
+    state = HEADER
+
+    with open(correct_file, "r") as correct:
+        for line in correct:
+            line = line.strip()
+            if not line:
+                continue
+
+            if state == SAVED:
+                tokens = line.split()
+                if tokens[0] == "total":
+                    result["shells"] = np.array(shells, dtype=SHELL_DTYPE)
+                    result["total"] = np.array(_shell_row(tokens, np.nan), dtype=SHELL_DTYPE)
+                    state = DONE
+                    continue
+                if line.startswith("RESOLUTION"):
+                    # Start of a (new) shell table
+                    shells = []
+                    continue
+                resolution = _number(tokens[0])
+                if len(tokens) >= 11 and not np.isnan(resolution):
+                    shells.append(_shell_row(tokens, resolution))
+                continue
+
+            if line.startswith("X-RAY_WAVELENGTH"):
+                result["wavelength"] = float(line.split()[1])
+            elif line.startswith("SPACE_GROUP_NUMBER"):
+                result["space_group"] = int(line.split()[1])
+            elif line.startswith("UNIT_CELL_CONSTANTS"):
+                result["cell"] = tuple(float(value) for value in line.split()[1:7])
+            elif line.startswith("INCLUDE_RESOLUTION_RANGE"):
+                line_list = line.split()
+                result["resolution_range"] = (float(line_list[1]), float(line_list[2]))
+            elif line.startswith("WILSON LINE (using all data)"):
+                result["wilson_b"] = float(line.split()[9])
+            elif state == HEADER and line.startswith(SAVED_DATA_SET):
+                state = SAVED
+
+    return result
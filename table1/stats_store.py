@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Append-only SQLite store of table1 statistics for queries across datasets"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+
+# Column name -> (statistics dict, key path)
+COLUMNS = {"wavelength": ("dataCollection", ["Wavelength"]),
+           "space_group": ("dataCollection", ["Space Group"]),
+           "a": ("dataCollection", ["Cell Dimensions", "a"]),
+           "b": ("dataCollection", ["Cell Dimensions", "b"]),
+           "c": ("dataCollection", ["Cell Dimensions", "c"]),
+           "alpha": ("dataCollection", ["Cell Dimensions", "alpha"]),
+           "beta": ("dataCollection", ["Cell Dimensions", "beta"]),
+           "gamma": ("dataCollection", ["Cell Dimensions", "gamma"]),
+           "resolution_low": ("dataCollection", ["Resolution Range", "Total", "Low"]),
+           "resolution_high": ("dataCollection", ["Resolution Range", "Total", "High"]),
+           "shell_low": ("dataCollection", ["Resolution Range", "High", "Low"]),
+           "shell_high": ("dataCollection", ["Resolution Range", "High", "High"]),
+           "redundancy": ("dataCollection", ["Redundancy", "Total"]),
+           "redundancy_high": ("dataCollection", ["Redundancy", "High"]),
+           "completeness": ("dataCollection", ["Completeness", "Total"]),
+           "completeness_high": ("dataCollection", ["Completeness", "High"]),
+           "i_sigma": ("dataCollection", ["Mean I/sigma(I)", "Total"]),
+           "i_sigma_high": ("dataCollection", ["Mean I/sigma(I)", "High"]),
+           "r_meas": ("dataCollection", ["Rmeas", "Total"]),
+           "r_meas_high": ("dataCollection", ["Rmeas", "High"]),
+           "cc_half": ("dataCollection", ["CC half", "Total"]),
+           "cc_half_high": ("dataCollection", ["CC half", "High"]),
+           "wilson_b": ("dataCollection", ["Wilson B factor"]),
+           "refinement_low": ("refinement", ["Resolution Included", "Low"]),
+           "refinement_high": ("refinement", ["Resolution Included", "High"]),
+           "r_work": ("refinement", ["Rwork/Rfree", "Work"]),
+           "r_free": ("refinement", ["Rwork/Rfree", "Free"]),
+           "bond_rmsd": ("refinement", ["Bond RMSD"]),
+           "angle_rmsd": ("refinement", ["Angle RMSD"]),
+           "rama_favored": ("refinement", ["Ramachandran", "Favored"]),
+           "rama_allowed": ("refinement", ["Ramachandran", "Allowed"]),
+           "rama_outliers": ("refinement", ["Ramachandran", "Outliers"]),
+           "rotamer_outliers": ("refinement", ["Rotamer Outliers"]),
+           "clashscore": ("refinement", ["All-atom Clashscore"]),
+           "b_overall": ("refinement", ["Average B factor", "Overall"]),
+           "b_protein": ("refinement", ["Average B factor", "Protein"]),
+           "b_ligand": ("refinement", ["Average B factor", "Ligand"]),
+           "b_water": ("refinement", ["Average B factor", "Water"])}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    created REAL NOT NULL,
+    correct_file TEXT,
+    pdb_file TEXT,
+    {", ".join(f"{column} {'INTEGER' if column == 'space_group' else 'REAL'}" for column in COLUMNS)},
+    data_collection TEXT,
+    refinement TEXT
+);
+CREATE TABLE IF NOT EXISTS latest (
+    dataset TEXT PRIMARY KEY,
+    id INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS latest_id ON latest (id);
+CREATE INDEX IF NOT EXISTS datasets_dataset ON datasets (dataset, id);
+CREATE INDEX IF NOT EXISTS datasets_resolution ON datasets (resolution_high);
+CREATE INDEX IF NOT EXISTS datasets_space_group ON datasets (space_group, resolution_high);
+CREATE INDEX IF NOT EXISTS datasets_r_free ON datasets (r_free);
+CREATE INDEX IF NOT EXISTS datasets_cc_half ON datasets (cc_half_high);
+"""
+
+
+def _lookup(statistics, keys):
+    """Follow the key path through the nested statistics dict"""
+    for key in keys:
+        statistics = statistics.get(key) if statistics else None
+    return statistics
+
+
+class StatsStore:
+    """Every added result is kept, queries only see the latest result of each dataset"""
+
+    def __init__(self, store_file):
+        self.connection = sqlite3.connect(store_file)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, dataset, data_collection, refinement, correct_file=None, pdb_file=None):
+        """Append the dataCollection and refinement dicts of a Table1 run"""
+        statistics = {"dataCollection": data_collection, "refinement": refinement}
+        values = [_lookup(statistics[source], keys) for source, keys in COLUMNS.values()]
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO datasets (dataset, created, correct_file, pdb_file, {', '.join(COLUMNS)}, data_collection, refinement) "
+                f"VALUES ({', '.join('?' * (len(COLUMNS) + 6))})",
+                [dataset, time.time(), correct_file, pdb_file] + values + [json.dumps(data_collection), json.dumps(refinement)])
+            self.connection.execute("INSERT OR REPLACE INTO latest (dataset, id) VALUES (?, ?)", (dataset, cursor.lastrowid))
+        return cursor.lastrowid
+
+    def add_table1(self, dataset, table1):
+        """Append the results of a Table1 object"""
+        return self.add(dataset, table1.dataCollection if table1.xds_correct else None,
+                        table1.refinement if table1.pdb_file else None,
+                        correct_file=table1.xds_correct, pdb_file=table1.pdb_file)
+
+    def query(self, space_group=None, max_resolution=None, max_r_free=None, min_cc_half=None, history=False):
+        """Datasets matching all given criteria, best resolution first
+
+        Resolution is the high resolution limit of the data, CC half the one of
+        the highest resolution shell. With history=True all stored results are returned.
+        """
+        conditions = []
+        parameters = []
+        for column, operator, value in [("space_group", "=", space_group),
+                                        ("resolution_high", "<=", max_resolution),
+                                        ("r_free", "<", max_r_free),
+                                        ("cc_half_high", ">=", min_cc_half)]:
+            if value is not None:
+                conditions.append(f"d.{column} {operator} ?")
+                parameters.append(value)
+
+        sql = "SELECT d.* FROM datasets d" if history else "SELECT d.* FROM datasets d JOIN latest l ON l.id = d.id"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY d.resolution_high"
+        return self.connection.execute(sql, parameters).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the table1 statistics store")
+    parser.add_argument("store", help="SQLite file written by table1.py --store")
+    parser.add_argument("--space-group", help="Space group number (e.g. 19 for P212121)", type=int)
+    parser.add_argument("--max-resolution", help="Highest resolution limit in A", type=float)
+    parser.add_argument("--max-rfree", help="Rfree in percent", type=float)
+    parser.add_argument("--min-cc-half", help="CC half of the highest resolution shell", type=float)
+    parser.add_argument("--history", help="Also show older results of each dataset", action="store_true")
+    args = parser.parse_args()
+
+    store = StatsStore(args.store)
+    rows = store.query(space_group=args.space_group, max_resolution=args.max_resolution,
+                       max_r_free=args.max_rfree, min_cc_half=args.min_cc_half, history=args.history)
+    columns = ["dataset", "created"] + list(COLUMNS)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    store.close()
@@ -1,10 +1,21 @@
 #!/usr/bin/env python
-import subprocess
 import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from correct_lp import parse_correct_lp
+from stats_store import StatsStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from structure_io import read_structure, b_factor_summary
+from phenix_stats import model_statistics, file_digest
 
 class Table1:
 
-    def __init__(self, xds_correct=None, pdb_file=None, cif_files=None, ligand_name=None):
+    def __init__(self, xds_correct=None, pdb_file=None, cif_files=None, ligand_name=None, use_cache=True):
         self.dataCollection = {"Wavelength": None,
                                "Space Group": None,
                                "Cell Dimensions": {"a": None, "b": None, "c": None,
@@ -29,70 +40,47 @@ class Table1:
         self.pdb_file = pdb_file
         self.cif_files = cif_files
         self.ligand_name = ligand_name
+        self.use_cache = use_cache
+        self.b_factors = None
+        self.timings = {}
     
     def get_data_collection(self):
         """Read all statistics from CORRECT.LP file"""
-        final_index = None
-        with open(self.xds_correct, "r") as correct:
-            correct_content = correct.readlines()
-            for index, line in enumerate(correct_content):
-                if line.strip().startswith("X-RAY_WAVELENGTH"):
-                    line_list = line.strip().split()
-                    self.dataCollection["Wavelength"] = float(line_list[1])
-            
-                if line.strip().startswith("SPACE_GROUP_NUMBER"):
-                    line_list = line.strip().split()
-                    self.dataCollection["Space Group"] = int(line_list[1])
-                
-                if line.strip().startswith("UNIT_CELL_CONSTANTS"):
-                    line_list = line.strip().split()
-                    self.dataCollection["Cell Dimensions"]["a"] = float(line_list[1])
-                    self.dataCollection["Cell Dimensions"]["b"] = float(line_list[2])
-                    self.dataCollection["Cell Dimensions"]["c"] = float(line_list[3])
-                    self.dataCollection["Cell Dimensions"]["alpha"] = float(line_list[4])
-                    self.dataCollection["Cell Dimensions"]["beta"] = float(line_list[5])
-                    self.dataCollection["Cell Dimensions"]["gamma"] = float(line_list[6])
-                
-                if line.strip().startswith("INCLUDE_RESOLUTION_RANGE"):
-                    line_list = line.strip().split()
-                    self.dataCollection["Resolution Range"]["Total"]["Low"] = float(line_list[1])
-                    self.dataCollection["Resolution Range"]["Total"]["High"] = float(line_list[2])
-
-                if line.strip().startswith('STATISTICS OF SAVED DATA SET "XDS_ASCII.HKL"'):
-                    final_index = index
-                
-                if line.strip().startswith("WILSON LINE (using all data)"):
-                    line_list = line.strip().split()
-                    self.dataCollection["Wilson B factor"] = float(line_list[9])
-            
-            for index, line in enumerate(correct_content[final_index:]):
-                
-                if line.strip().startswith("total"):
-                    total_line = line.strip().split()
-                    hres_line = correct_content[final_index + index - 1].strip().split()
-
-                    self.dataCollection["Resolution Range"]["High"]["Low"] = float(correct_content[final_index + index - 2].strip().split()[0])
-                    self.dataCollection["Resolution Range"]["High"]["High"] = float(hres_line[0])
-
-                    self.dataCollection["Redundancy"]["Total"] = float(total_line[1]) / float(total_line[2])
-                    self.dataCollection["Redundancy"]["High"] = float(hres_line[1]) / float(hres_line[2])
-
-                    self.dataCollection["Completeness"]["Total"] = float(total_line[4][:-1])
-                    self.dataCollection["Completeness"]["High"] = float(hres_line[4][:-1])
-
-                    self.dataCollection["Mean I/sigma(I)"]["Total"] = float(total_line[8])
-                    self.dataCollection["Mean I/sigma(I)"]["High"] = float(hres_line[8])
-
-                    self.dataCollection["Rmeas"]["Total"] = float(total_line[9][:-1])
-                    self.dataCollection["Rmeas"]["High"] = float(hres_line[9][:-1])
-
-                    try:
-                        self.dataCollection["CC half"]["Total"] = float(total_line[10])
-                        self.dataCollection["CC half"]["High"] = float(hres_line[10])
-                    except ValueError:
-                        self.dataCollection["CC half"]["Total"] = float(total_line[10][:-1])
-                        self.dataCollection["CC half"]["High"] = float(hres_line[10][:-1])        
-        
+        correct = parse_correct_lp(self.xds_correct)
+        shells = correct["shells"]
+        total = correct["total"]
+        hres = shells[-1]
+
+        self.dataCollection["Wavelength"] = correct["wavelength"]
+        self.dataCollection["Space Group"] = correct["space_group"]
+        for key, value in zip(("a", "b", "c", "alpha", "beta", "gamma"), correct["cell"]):
+            self.dataCollection["Cell Dimensions"][key] = value
+        self.dataCollection["Resolution Range"]["Total"]["Low"] = correct["resolution_range"][0]
+        self.dataCollection["Resolution Range"]["Total"]["High"] = correct["resolution_range"][1]
+        self.dataCollection["Wilson B factor"] = correct["wilson_b"]
+
+        # The high resolution shell starts at the limit of the previous shell
+        if len(shells) > 1:
+            self.dataCollection["Resolution Range"]["High"]["Low"] = float(shells[-2]["resolution"])
+        else:
+            self.dataCollection["Resolution Range"]["High"]["Low"] = correct["resolution_range"][0]
+        self.dataCollection["Resolution Range"]["High"]["High"] = float(hres["resolution"])
+
+        self.dataCollection["Redundancy"]["Total"] = float(total["observed"] / total["unique"])
+        self.dataCollection["Redundancy"]["High"] = float(hres["observed"] / hres["unique"])
+
+        self.dataCollection["Completeness"]["Total"] = float(total["completeness"])
+        self.dataCollection["Completeness"]["High"] = float(hres["completeness"])
+
+        self.dataCollection["Mean I/sigma(I)"]["Total"] = float(total["i_sigma"])
+        self.dataCollection["Mean I/sigma(I)"]["High"] = float(hres["i_sigma"])
+
+        self.dataCollection["Rmeas"]["Total"] = float(total["r_meas"])
+        self.dataCollection["Rmeas"]["High"] = float(hres["r_meas"])
+
+        self.dataCollection["CC half"]["Total"] = float(total["cc_half"])
+        self.dataCollection["CC half"]["High"] = float(hres["cc_half"])
+
     def get_refinement(self):
         """Read all statistics from refinement"""
 
@@ -110,65 +98,56 @@ class Table1:
                     self.refinement["Rwork/Rfree"]["Free"] = float(line.strip().split()[-1])*100
 
 
-        if self.cif_files:
-            cif_str = " ".join(str(cif) for cif in self.cif_files)
-            ref_stats_command = f"phenix.model_statistics {self.pdb_file} {cif_str}"
-        else:
-            ref_stats_command = f"phenix.model_statistics {self.pdb_file}"
-        ref_stats = subprocess.run(ref_stats_command, shell=True, capture_output=True, text=True) # Run phenix.model_statistics
-
-        for index, line in enumerate(ref_stats.stdout.splitlines()): # Get all parameters from output
-            if line.strip().startswith("Bond"):
-                line_list = line.strip().split()
-                self.refinement["Bond RMSD"] = float(line_list[2])
-            if line.strip().startswith("Angle"):
-                line_list = line.strip().split()
-                self.refinement["Angle RMSD"] = float(line_list[2])
-            if line.strip().startswith("Ramachandran Plot"):
-                outl_index = index + 1
-                allowed_index = index + 2
-                favored_index = index + 3
-
-                outl_list = ref_stats.stdout.splitlines()[outl_index].strip().split()
-                self.refinement["Ramachandran"]["Outliers"] = float(outl_list[2])
-                    
-                allowed_list = ref_stats.stdout.splitlines()[allowed_index].strip().split()
-                self.refinement["Ramachandran"]["Allowed"] = float(allowed_list[2])
-
-                favored_list = ref_stats.stdout.splitlines()[favored_index].strip().split()
-                self.refinement["Ramachandran"]["Favored"] = float(favored_list[2])
-
-            if line.strip().startswith("Rotamer Outliers"):
-                line_list = line.strip().split()
-                self.refinement["Rotamer Outliers"] = float(line_list[3])
-            if line.strip().startswith("All-atom Clashscore"):
-                line_list = line.strip().split()
-                self.refinement["All-atom Clashscore"] = float(line_list[-1])
-            
-            if line.strip().startswith("Overall:"):
-                line_list = line.strip().split()
-                self.refinement["Average B factor"]["Overall"] = float(line_list[3])
-            if line.strip().startswith("Protein:"):
-                line_list = line.strip().split()
-                self.refinement["Average B factor"]["Protein"] = float(line_list[3])
-            if line.strip().startswith("Water:"):
-                line_list = line.strip().split()
-                self.refinement["Average B factor"]["Water"] = float(line_list[3])
+        statistics = model_statistics(self.pdb_file, self.cif_files, use_cache=self.use_cache)
+        for key in ["Bond RMSD", "Angle RMSD", "Rotamer Outliers", "All-atom Clashscore"]:
+            self.refinement[key] = statistics[key]
+        self.refinement["Ramachandran"].update(statistics["Ramachandran"])
+        self.refinement["Average B factor"].update(statistics["Average B factor"])
     
     def get_b_factor(self):
-
-        mini_script = f"cmd.load('{self.pdb_file}'); cmd.select('dummy', 'resn {self.ligand_name}'); cmd.do('average_b_factor dummy')"
-        b_factor = subprocess.run(["pymol", "-cd", mini_script], check=True, capture_output=True, text=True)
-        self.refinement["Average B factor"]["Ligand"] = float(b_factor.stdout.splitlines()[-1])
-
-    def make_statistics(self):
-        """Run all methods to get statistics"""
+        """Average ligand B factor, read directly from the model"""
+        self.b_factors = b_factor_summary(read_structure(self.pdb_file), self.ligand_name)
+        if self.b_factors["Ligand"] is None:
+            raise ValueError(f"No atoms with residue name {self.ligand_name} found in {self.pdb_file}")
+        self.refinement["Average B factor"]["Ligand"] = self.b_factors["Ligand"]
+
+    def _timed(self, stage, method):
+        """Run one stage and keep its wall-clock time"""
+        start = time.perf_counter()
+        method()
+        self.timings[stage] = time.perf_counter() - start
+
+    def stages(self):
+        """Stages that apply to the given inputs as (name, method, input files)"""
+        stages = []
         if self.xds_correct:
-            self.get_data_collection()
+            stages.append(("Data collection", self.get_data_collection, [self.xds_correct]))
         if self.pdb_file:
-            self.get_refinement()
+            stages.append(("Refinement", self.get_refinement, [self.pdb_file] + list(self.cif_files or [])))
         if self.ligand_name:
-            self.get_b_factor()
+            stages.append(("B factor", self.get_b_factor, [self.pdb_file]))
+        return stages
+
+    def make_statistics(self, only=None):
+        """Run all methods to get statistics
+
+        The stages are independent, so they run concurrently and the phenix
+        subprocess overlaps with parsing CORRECT.LP and the model. With only
+        (list of stage names) just these stages are rerun.
+        """
+        stages = [(stage, method) for stage, method, _ in self.stages() if only is None or stage in only]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(len(stages), 1)) as executor:
+            futures = [executor.submit(self._timed, stage, method) for stage, method in stages]
+            for future in futures:
+                future.result()
+        self.timings["Total"] = time.perf_counter() - start
+
+    def print_timings(self):
+        """Print wall-clock time of each stage"""
+        for stage, seconds in self.timings.items():
+            print(f"{stage:<16} {seconds:8.3f} s")
 
 
     def make_output_formating(self):
@@ -216,19 +195,132 @@ class Table1:
         return total_out  
 
 
-    def create_out_file(self):
+    def create_out_file(self, filename="table1.csv"):
         """Create table1.csv file"""
         output = self.make_output_formating()
 
-        with open("table1.csv", "w") as out_file:
+        with open(filename, "w") as out_file:
             for line in output:
                 out_file.write(line[0] + "," + line[1] + "\n")
-        
 
 
-
-        
-
+def watch(table1, filename="table1.csv", interval=0.5, store=None, name=None):
+    """Rewrite the table whenever an input file changes, until interrupted
+
+    Files are tracked by content hash (only rehashed if mtime or size changed),
+    only the stages depending on changed files are rerun.
+    """
+    stages = table1.stages()
+    paths = {path for _, _, inputs in stages for path in inputs}
+    seen = {}  # path -> (mtime, size) at the last check
+    digests = {}  # path -> content hash used for the current table
+
+    while True:
+        changed = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if seen.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            seen[path] = (stat.st_mtime_ns, stat.st_size)
+            digest = file_digest(path)
+            if digest != digests.get(path):
+                changed[path] = digest
+
+        rerun = [stage for stage, _, inputs in stages if changed.keys() & set(inputs)]
+        if rerun:
+            try:
+                table1.make_statistics(only=rerun)
+                table1.create_out_file(filename)
+                if store:
+                    store.add_table1(name, table1)
+                digests.update(changed)
+                print(f"{time.strftime('%H:%M:%S')} updated {filename} ({', '.join(rerun)}: {table1.timings['Total']:.2f} s)")
+            except Exception as e:
+                # Probably a file that is still being written, check it again
+                print(f"{time.strftime('%H:%M:%S')} Error updating {filename}: {e}")
+                for path in changed:
+                    seen.pop(path, None)
+        time.sleep(interval)
+
+
+def read_manifest(manifest_file):
+    """Read batch manifest (csv with columns name, correct, pdb, cif, ligand)
+
+    Empty fields are skipped, multiple cif files are separated by spaces.
+    Unnamed rows are called dataset_N, names have to be unique (they are the column headers).
+    """
+    datasets = []
+    with open(manifest_file, "r", newline="") as manifest:
+        for row in csv.DictReader(manifest):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            datasets.append({"name": row.get("name") or None,
+                             "xds_correct": row.get("correct") or None,
+                             "pdb_file": row.get("pdb") or None,
+                             "cif_files": row.get("cif", "").split() or None,
+                             "ligand_name": row.get("ligand") or None})
+    names = [dataset["name"] for dataset in datasets if dataset["name"]]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate dataset names in {manifest_file}: {', '.join(duplicates)}")
+    for i, dataset in enumerate(datasets, 1):
+        if dataset["name"] is None:
+            # Skip numbers already used as a name in the manifest
+            number = i
+            while f"dataset_{number}" in names:
+                number += 1
+            dataset["name"] = f"dataset_{number}"
+            names.append(dataset["name"])
+    return datasets
+
+
+def run_dataset(dataset, use_cache=True):
+    """Build the table1 rows of a single manifest entry (runs in a worker process)"""
+    table1 = Table1(xds_correct=dataset["xds_correct"], pdb_file=dataset["pdb_file"],
+                    cif_files=dataset["cif_files"], ligand_name=dataset["ligand_name"], use_cache=use_cache)
+    table1.make_statistics()
+    return table1
+
+
+def make_batch_table(datasets, filename="table1.csv", max_workers=None, use_cache=True, store=None):
+    """Run all datasets in a process pool and write one column per dataset
+
+    Results are also appended to the StatsStore if one is given.
+    Returns the stage timings of every dataset.
+    """
+    # Results are kept by manifest position so that datasets with the same name do not overwrite each other
+    results = [{} for _ in datasets]
+    timings = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        future_to_index = {executor.submit(run_dataset, dataset, use_cache): i for i, dataset in enumerate(datasets)}
+        for future in as_completed(future_to_index):
+            i = future_to_index[future]
+            name = datasets[i]["name"]
+            try:
+                table1 = future.result()
+                results[i] = dict(table1.make_output_formating())
+                timings[name] = table1.timings
+                if store:
+                    store.add_table1(name, table1)
+            except Exception as e:
+                print(f"Error processing dataset {name}: {e}")
+
+    # Keep the row order of the datasets, rows missing in a dataset stay empty
+    labels = []
+    for result in results:
+        for label in result:
+            if label not in labels:
+                labels.append(label)
+
+    with open(filename, "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow([""] + [dataset["name"] for dataset in datasets])
+        for label in labels:
+            writer.writerow([label] + [result.get(label, "") for result in results])
+
+    return timings
 
 
 if __name__ == "__main__":
@@ -244,13 +336,57 @@ if __name__ == "__main__":
     # cif files are optional
     parser.add_argument("-f", "--cif", help="CIF files from refinement", required=False, nargs="+")
     parser.add_argument("-l", "--ligand", help="Ligand name", required=False)
+    # Batch mode: manifest with one dataset per line, one column per dataset in the output
+    parser.add_argument("-b", "--batch", help="Manifest csv (name,correct,pdb,cif,ligand) to build a multi-column table1", required=False)
+    parser.add_argument("-j", "--jobs", help="Number of parallel processes in batch mode", type=int, required=False)
+    parser.add_argument("-o", "--output", help="Output file", default="table1.csv")
+    parser.add_argument("-w", "--watch", help="Keep running and update the table when an input file changes", action="store_true")
+    parser.add_argument("--no-cache", help="Always rerun phenix.model_statistics", action="store_true")
+    parser.add_argument("--timings", help="Print the wall-clock time of each stage", action="store_true")
+    parser.add_argument("--timings-json", help="Write the stage timings to a json file", required=False)
+    # Statistics store for queries across datasets (see stats_store.py)
+    parser.add_argument("--store", help="Append the results to this SQLite statistics store", required=False)
+    parser.add_argument("--name", help="Dataset name in the statistics store (default: pdb or CORRECT.LP path)", required=False)
 
     # Parse arguments
     args = parser.parse_args()
 
-    # Create table1 object
-    table1 = Table1(xds_correct=args.correct, pdb_file=args.pdb, cif_files=args.cif, ligand_name=args.ligand)
-    table1.make_statistics()
-    table1.create_out_file()
+    store = StatsStore(args.store) if args.store else None
+
+    if args.batch:
+        timings = make_batch_table(read_manifest(args.batch), filename=args.output, max_workers=args.jobs,
+                                   use_cache=not args.no_cache, store=store)
+        if args.timings:
+            for name, dataset_timings in timings.items():
+                print(name)
+                for stage, seconds in dataset_timings.items():
+                    print(f"  {stage:<16} {seconds:8.3f} s")
+    else:
+        # Create table1 object
+        table1 = Table1(xds_correct=args.correct, pdb_file=args.pdb, cif_files=args.cif, ligand_name=args.ligand,
+                        use_cache=not args.no_cache)
+        if args.watch:
+            try:
+                watch(table1, filename=args.output, store=store, name=args.name or args.pdb or args.correct)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if store:
+                    store.close()
+            sys.exit(0)
+        table1.make_statistics()
+        table1.create_out_file(args.output)
+        if store:
+            store.add_table1(args.name or args.pdb or args.correct, table1)
+        timings = table1.timings
+        if args.timings:
+            table1.print_timings()
+
+    if store:
+        store.close()
+
+    if args.timings_json:
+        with open(args.timings_json, "w") as out_file:
+            json.dump(timings, out_file, indent=2)
 
 
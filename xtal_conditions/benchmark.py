@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Benchmark the xtalcond fetch backends against a local mock RCSB server (runs offline)"""
+import argparse
+import json
+import time
+
+import requests
+
+import xtalcond
+from mock_rcsb import MockServer
+
+UNIPROT = "P00533"
+
+
+def percentile(values, q):
+    """q-th percentile (nearest rank) of the values, 0 if there are none"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+def measure(server, name, api, jobs, pdb_ids, retries=5, graphql_chunk=xtalcond.GRAPHQL_CHUNK):
+    """Fetch all entries with one backend (new session, no cache), returns the result row"""
+    backend = xtalcond.make_backend(name, session=requests.Session(), api=api, jobs=jobs, retries=retries, graphql_chunk=graphql_chunk)
+    rows = {"ok": 0, "failed": 0}
+
+    def on_row(pdb_id, row):
+        rows["ok" if row else "failed"] += 1
+
+    server.reset()
+    start = time.perf_counter()
+    backend.fetch(pdb_ids, on_row)
+    seconds = time.perf_counter() - start
+    latencies = backend.client.latencies
+    return {"backend": name, "api": api, "jobs": jobs, "entries": rows["ok"], "failed": rows["failed"],
+            "seconds": seconds, "entries_per_second": rows["ok"] / seconds,
+            "requests": backend.statistics["requests"], "retries": backend.statistics["retries"],
+            "server_requests": server.statistics()["requests"],
+            "p50_ms": percentile(latencies, 50) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000}
+
+
+def run_benchmark(backends, apis, jobs_list, entries=200, latency=0.05, jitter=0.0, error_rate=0.0, retries=5,
+                  graphql_chunk=xtalcond.GRAPHQL_CHUNK):
+    """Every backend and api with every number of jobs (the serial backend once) on the same entries"""
+    results = []
+    with MockServer(latency=latency, jitter=jitter, error_rate=error_rate, entries=entries) as server:
+        xtalcond.set_server(server.url)
+        search = xtalcond.make_backend("serial", session=requests.Session(), jobs=1, retries=retries)
+        pdb_ids = list(search.search([(UNIPROT, None)])[0])
+
+        for name in backends:
+            for api in apis:
+                for jobs in [1] if name == "serial" else jobs_list:
+                    result = measure(server, name, api, jobs, pdb_ids, retries=retries, graphql_chunk=graphql_chunk)
+                    print_results([result], header=not results)
+                    results.append(result)
+    return results
+
+
+def print_results(results, header=True):
+    """Print the benchmark results as a table"""
+    if header:
+        print(f"{'backend':<9} {'api':<8} {'jobs':>5} {'entries':>8} {'failed':>7} {'time (s)':>9} {'entries/s':>10} "
+              f"{'requests':>9} {'retries':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for result in results:
+        print(f"{result['backend']:<9} {result['api']:<8} {result['jobs']:5d} {result['entries']:8d} {result['failed']:7d} "
+              f"{result['seconds']:9.2f} {result['entries_per_second']:10.1f} {result['requests']:9d} {result['retries']:8d} "
+              f"{result['p50_ms']:9.1f} {result['p95_ms']:9.1f} {result['p99_ms']:9.1f}")
+
+
+def print_best(results):
+    """Fastest number of jobs of every backend and api without failed entries"""
+    best = {}
+    for result in results:
+        key = (result["backend"], result["api"])
+        if not result["failed"] and (key not in best or result["entries_per_second"] > best[key]["entries_per_second"]):
+            best[key] = result
+    print()
+    for (name, api), result in best.items():
+        print(f"Fastest {name}/{api}: -jobs {result['jobs']} ({result['entries_per_second']:.1f} entries/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-backends", help="Backends to compare", nargs="+", choices=list(xtalcond.BACKENDS), default=list(xtalcond.BACKENDS))
+    parser.add_argument("-apis", help="APIs to compare", nargs="+", choices=xtalcond.APIS, default=xtalcond.APIS)
+    parser.add_argument("-jobs", help="Concurrent requests to try", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    parser.add_argument("-entries", help="Entries fetched by every run", type=int, default=200)
+    parser.add_argument("-latency", help="Seconds the mock server delays every response", type=float, default=0.05)
+    parser.add_argument("-jitter", help="Mean of an additional exponential delay in seconds (tail latency)", type=float, default=0.0)
+    parser.add_argument("-error_rate", help="Fraction of requests the mock server answers with 429/500/503", type=float, default=0.0)
+    parser.add_argument("-retries", help="Retries of failed requests", type=int, default=5)
+    parser.add_argument("-graphql_chunk", help="Entries per GraphQL request", type=int, default=xtalcond.GRAPHQL_CHUNK)
+    parser.add_argument("-json", help="Also write the results to a json file (e.g. to compare runs)", required=False)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.backends, args.apis, args.jobs, entries=args.entries, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, retries=args.retries, graphql_chunk=args.graphql_chunk)
+    print_best(results)
+    if args.json:
+        with open(args.json, "w") as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Local mock of the RCSB search, REST, FASTA and GraphQL endpoints with configurable latency and error rate"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+ALPHANUMERIC = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+HOSTS = ["Escherichia coli", "Spodoptera frugiperda", "Homo sapiens"]
+
+SETTINGS = {
+    "latency": 0.05,     # seconds every response is delayed
+    "jitter": 0.0,       # mean of an additional exponentially distributed delay (the tail)
+    "error_rate": 0.0,   # fraction of requests answered with 429/500/503
+    "entries": 100,      # search hits per UniProt ID
+}
+
+
+def _number(*parts):
+    """Deterministic number of the parts, the same entry always looks the same"""
+    return int(hashlib.md5("/".join(map(str, parts)).encode()).hexdigest()[:12], 16)
+
+
+def search_hits(uniprot, entries):
+    """PDB IDs found for a UniProt ID (digit + 3 alphanumeric characters, unique for up to 46656 entries)"""
+    digit, offset = _number(uniprot) % 9 + 1, _number(uniprot, "offset")
+    hits = []
+    for i in range(entries):
+        number = (offset + i) % 36 ** 3
+        hits.append(f"{digit}" + "".join(ALPHANUMERIC[number // 36 ** power % 36] for power in (2, 1, 0)))
+    return hits
+
+
+def entity_count(pdb_id):
+    return _number(pdb_id, "entities") % 3 + 1
+
+
+def sequence(pdb_id, entity):
+    length = 50 + _number(pdb_id, entity, "length") % 300
+    return "".join(random.Random(_number(pdb_id, entity)).choices(AMINO_ACIDS, k=length))
+
+
+def entry_document(pdb_id):
+    """REST entry document with the fields xtal_conditions reads"""
+    number = _number(pdb_id)
+    return {
+        "rcsb_id": pdb_id,
+        "rcsb_entry_container_identifiers": {"polymer_entity_ids": [str(i) for i in range(1, entity_count(pdb_id) + 1)]},
+        "exptl_crystal_grow": [{"pdbx_details": f"0.1 M HEPES pH {6 + number % 30 / 10:.1f}, {10 + number % 20}% (w/v) PEG 3350",
+                                "temp": 277 + number % 2 * 16, "method": "VAPOR DIFFUSION, SITTING DROP"}],
+        "audit_author": [{"name": f"Author, {chr(65 + i)}."} for i in range(1 + number % 4)],
+        "citation": [{"pdbx_database_id_doi": f"10.1000/mock.{number % 100000}", "journal_abbrev": "Mock J."}],
+        "rcsb_entry_info": {"diffrn_resolution_high": {"value": round(1.2 + number % 180 / 100, 2)}},
+        "cell": {"length_a": 50.0 + number % 50, "length_b": 60.0 + number % 40, "length_c": 70.0 + number % 30,
+                 "angle_alpha": 90.0, "angle_beta": 90.0, "angle_gamma": 90.0},
+        "symmetry": {"space_group_name_hm": "P 21 21 21", "int_tables_number": 19},
+    }
+
+
+def polymer_entity(pdb_id, entity):
+    return {"rcsb_id": f"{pdb_id}_{entity}",
+            "entity_poly": {"pdbx_seq_one_letter_code_can": sequence(pdb_id, entity)},
+            "rcsb_entity_host_organism": [{"ncbi_scientific_name": HOSTS[_number(pdb_id, entity, "host") % len(HOSTS)]}]}
+
+
+def fasta(pdb_id):
+    return "".join(f">{pdb_id}_{entity}|Chain {chr(64 + entity)}|mock\n{sequence(pdb_id, entity)}\n"
+                   for entity in range(1, entity_count(pdb_id) + 1))
+
+
+def graphql_entry(pdb_id):
+    """Entry of the GraphQL API (mmCIF case, polymer entities nested)"""
+    entry = entry_document(pdb_id)
+    del entry["rcsb_entry_container_identifiers"]
+    entry["citation"] = [{"pdbx_database_id_DOI": citation["pdbx_database_id_doi"], "journal_abbrev": citation["journal_abbrev"]}
+                         for citation in entry["citation"]]
+    entry["symmetry"] = {"space_group_name_H_M": "P 21 21 21", "Int_Tables_number": 19}
+    entry["polymer_entities"] = [polymer_entity(pdb_id, entity) for entity in range(1, entity_count(pdb_id) + 1)]
+    return entry
+
+
+class MockRCSBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like RCSB
+    disable_nagle_algorithm = True  # headers and body are separate writes, delayed ACKs would add 40 ms
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, document):
+        self._send(200, json.dumps(document).encode())
+
+    def _simulate(self):
+        """Count the request, wait and maybe fail it, returns False if the request was answered with an error"""
+        settings, statistics = self.server.settings, self.server.statistics
+        with self.server.lock:
+            statistics["requests"] += 1
+        delay = settings["latency"] + (random.expovariate(1 / settings["jitter"]) if settings["jitter"] else 0.0)
+        time.sleep(delay)
+        if random.random() < settings["error_rate"]:
+            with self.server.lock:
+                statistics["errors"] += 1
+            self._send(random.choice([429, 500, 503]), headers={"Retry-After": "0"})
+            return False
+        return True
+
+    def _control(self, body=None):
+        """Statistics and settings of the server (not counted, never delayed)"""
+        with self.server.lock:
+            if self.path == "/__reset":
+                self.server.statistics.update(requests=0, errors=0)
+            elif self.path == "/__settings" and body:
+                self.server.settings.update(json.loads(body))
+            self._send_json({**self.server.statistics, "settings": self.server.settings})
+
+    def do_GET(self):
+        if self.path.startswith("/__"):
+            return self._control()
+        if not self._simulate():
+            return
+        parts = self.path.strip("/").split("/")
+        if self.path.startswith("/rest/v1/core/entry/") and len(parts) == 5:
+            self._send_json(entry_document(parts[4].upper()))
+        elif self.path.startswith("/rest/v1/core/polymer_entity/") and len(parts) == 6 and parts[5].isdigit() \
+                and 1 <= int(parts[5]) <= entity_count(parts[4].upper()):
+            self._send_json(polymer_entity(parts[4].upper(), int(parts[5])))
+        elif self.path.startswith("/fasta/entry/") and len(parts) == 4:
+            self._send(200, fasta(parts[2].upper()).encode(), content_type="text/plain")
+        else:
+            self._send(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/__"):
+            return self._control(body)
+        if not self._simulate():
+            return
+        try:
+            query = json.loads(body)
+        except ValueError:
+            return self._send(400)
+        if self.path == "/rcsbsearch/v2/query":
+            uniprot = query["query"]["nodes"][0]["parameters"]["value"]
+            # A search restricted by date (sync) finds a tenth of the entries
+            dated = len(query["query"]["nodes"]) > 4
+            hits = search_hits(uniprot, self.server.settings["entries"])
+            hits = hits[::10] if dated else hits
+            self._send_json({"total_count": len(hits), "result_set": [{"identifier": pdb_id} for pdb_id in hits]})
+        elif self.path == "/graphql":
+            self._send_json({"data": {"entries": [graphql_entry(pdb_id.upper()) for pdb_id in query["variables"]["ids"]]}})
+        else:
+            self._send(404)
+
+
+class MockRCSBServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, settings=None):
+        super().__init__(address, MockRCSBHandler)
+        self.settings = {**SETTINGS, **(settings or {})}
+        self.statistics = {"requests": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+
+def serve(port=0, settings=None, port_queue=None):
+    """Run a server until the process ends, the port it listens on is put into port_queue"""
+    server = MockRCSBServer(("127.0.0.1", port), settings)
+    if port_queue is not None:
+        port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+class MockServer:
+    """MockRCSBServer in its own process (the client being measured keeps the GIL to itself)
+
+        with MockServer(latency=0.02) as server:
+            xtalcond.set_server(server.url)
+    """
+
+    def __init__(self, **settings):
+        self.settings = settings
+
+    def __enter__(self):
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(0, self.settings, port_queue), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+    def _control(self, path, settings=None):
+        data = json.dumps(settings).encode() if settings else b"{}"
+        with urllib.request.urlopen(urllib.request.Request(self.url + path, data=data, method="POST")) as response:
+            return json.load(response)
+
+    def statistics(self):
+        return self._control("/__stats")
+
+    def reset(self):
+        """Set the request counters to zero"""
+        return self._control("/__reset")
+
+    def configure(self, **settings):
+        """Change latency, jitter, error_rate or entries of the running server"""
+        return self._control("/__settings", settings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-port", help="Port to listen on", type=int, default=8000)
+    parser.add_argument("-latency", help="Seconds every response is delayed", type=float, default=SETTINGS["latency"])
+    parser.add_argument("-jitter", help="Mean of an additional exponential delay in seconds", type=float, default=SETTINGS["jitter"])
+    parser.add_argument("-error_rate", help="Fraction of requests answered with 429/500/503", type=float, default=SETTINGS["error_rate"])
+    parser.add_argument("-entries", help="Search hits per UniProt ID", type=int, default=SETTINGS["entries"])
+    args = parser.parse_args()
+    print(f"Mock RCSB on http://127.0.0.1:{args.port}, use with -server http://127.0.0.1:{args.port}")
+    serve(args.port, {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "entries": args.entries})
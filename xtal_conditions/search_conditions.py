@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import re
+import sys
+import time
+
+from xtalcond.conditions import ConditionIndex, format_component, index_file
+
+COMPONENT_SPEC = re.compile(r"^(?P<name>[^:]+?)\s*(?::\s*(?P<low>[\d.]*)\s*-\s*(?P<high>[\d.]*)\s*(?P<unit>mM|M|%)?)?$")
+
+
+def parse_component(spec):
+    """'PEG 3350:15-25%' -> ('PEG 3350', 15.0, 25.0, '%'), mM is converted to M"""
+    match = COMPONENT_SPEC.match(spec.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Component '{spec}' is not NAME or NAME:MIN-MAX[M|mM|%]")
+    low, high, unit = [float(value) if value else None for value in match.group("low", "high")] + [match.group("unit")]
+    if unit == "mM":
+        low, high, unit = [value / 1000 if value is not None else None for value in (low, high)] + ["M"]
+    return match.group("name"), low, high, unit
+
+
+def main(csv_file, components, ph=None, kinds=(), summary=False, rebuild=False, store_file=None):
+    start = time.perf_counter()
+    index = ConditionIndex.for_csv(csv_file, store_file=store_file, rebuild=rebuild)
+    print(f"Index '{store_file or index_file(csv_file)}' ready after {time.perf_counter() - start:.2f} s.", file=sys.stderr)
+    writer = csv.writer(sys.stdout)
+    if summary:
+        writer.writerow(["COMPONENT", "KIND", "UNIT", "ENTRIES", "MIN", "MAX"])
+        for row in index.summary(kinds[0] if kinds else None):
+            writer.writerow(list(row))
+    else:
+        start = time.perf_counter()
+        entries = index.query(components=components, ph=ph, kinds=kinds)
+        writer.writerow(["PDB_ID", "PH", "COMPONENTS", "XTAL_DETAILS"])
+        for entry in entries:
+            writer.writerow([entry["pdb_id"], entry["ph"], "; ".join(format_component(c) for c in entry["components"]), entry["details"]])
+        print(f"{len(entries)} entries found in {1000 * (time.perf_counter() - start):.1f} ms.", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the crystallization conditions (XTAL_DETAILS) of a table by component, concentration and pH.")
+    parser.add_argument("csv_file", help="Table of parallel_xtal_conditions/get_xtal_conditions", type=str)
+    parser.add_argument("-component", help="Component every entry has, NAME or NAME:MIN-MAX[M|mM|%%], NAME* matches all names starting with NAME "
+                        "(e.g. -component 'PEG*:15-25%%' -component 'ammonium sulfate'), can be repeated",
+                        type=parse_component, action="append", default=[])
+    parser.add_argument("-ph", help="pH range of the entries", type=float, nargs=2, metavar=("MIN", "MAX"))
+    parser.add_argument("-kind", help="Entries having a component of this kind (with -summary: only list this kind)",
+                        choices=["precipitant", "salt", "buffer", "additive"], action="append", default=[])
+    parser.add_argument("-summary", help="List the components of the table with their number of entries and concentration range", action="store_true")
+    parser.add_argument("-index", help="Index file (default: CSV_FILE.conditions.sqlite, rebuilt when the table changes)", type=str)
+    parser.add_argument("-rebuild", help="Parse the table again even if the index is up to date", action="store_true")
+    args = parser.parse_args()
+    main(args.csv_file, args.component, ph=args.ph, kinds=args.kind, summary=args.summary, rebuild=args.rebuild, store_file=args.index)
@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+"""Typed Parquet/Arrow copy of a xtal_conditions csv with a deduplicated sequence table (needs pyarrow)"""
+import argparse
+
+from xtalcond.columnar import sequences_file, write_columnar
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("csv_file", help="Table written by get_xtal_conditions.py/parallel_xtal_conditions.py")
+    parser.add_argument("out_file", help="Output file, .parquet or .arrow")
+    args = parser.parse_args()
+    rows, unique = write_columnar(args.csv_file, args.out_file)
+    print(f"Typed table '{args.out_file}' written with {rows} entries, {unique} unique sequences in '{sequences_file(args.out_file)}'.")
@@ -0,0 +1,14 @@
+"""Crystallization conditions of RCSB entries: searches, csv rows and tables with pluggable fetch backends
+
+    from xtalcond import make_backend, xtal_table
+    xtal_table(make_backend("async", jobs=20), "P00533", "egfr.csv")
+"""
+from .rcsb import COLUMNS, search_query, parse_search, set_server
+from .http_cache import CachedSession, ResponseCache
+from .fetch_engine import Client, FetchEngine
+from .csv_stream import CheckpointedCsv
+from .backends import (APIS, BACKENDS, GRAPHQL_CHUNK, Backend, SerialBackend, ThreadedBackend, AsyncBackend,
+                       get_list_of_pdbs, make_backend)
+from .tables import make_xtal_csv, make_batch_csv, xtal_table, read_uniprot_ids
+from .columnar import write_columnar, read_columnar
+from .conditions import Component, Condition, ConditionIndex, parse_conditions
@@ -0,0 +1,205 @@
+"""Fetch backends: how the requests for searches and csv rows are run (serial, threads or asyncio)"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from . import rcsb
+from .fetch_engine import Client, FetchEngine
+from .http_cache import CachedSession
+
+# Entries per GraphQL request
+GRAPHQL_CHUNK = 100
+# rest: several requests per entry, graphql: one request per chunk of entries
+APIS = ["rest", "graphql"]
+
+
+def get_list_of_pdbs(client, uniprot, result_type="entry", since=None):
+    """Get list of PDBs based on UniProt ID (only those released or revised since the date if given), None if the search failed."""
+    try:
+        return rcsb.parse_search(client.post_json(rcsb.SEARCH_URL, rcsb.search_query(uniprot, result_type, since)))
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error fetching PDB list of {uniprot}: {e}")
+        return None
+
+
+def rest_entry(client, pdb_id):
+    """CSV row of one entry from the REST API, one request after the other."""
+    try:
+        data = client.get_json(f"{rcsb.RCSB_BASE_ENTRY}{pdb_id}")
+        entity_names = data.get("rcsb_entry_container_identifiers", {}).get("polymer_entity_ids", [])
+        fasta, *entities = [_result(client.get_text, rcsb.FASTA_URL_TEMPLATE.format(pdb_id=pdb_id))] + \
+                           [_result(client.get_json, f"{rcsb.RCSB_BASE_POLYMER}/{pdb_id}/{entity}") for entity in entity_names]
+        return rcsb.rest_row(pdb_id, data, fasta, entities)
+    except Exception as e:
+        print(f"Error processing PDB ID {pdb_id}: {e}")
+        return None
+
+
+def _result(function, *args):
+    """Result of the call or the exception it raised (like asyncio.gather(return_exceptions=True))"""
+    try:
+        return function(*args)
+    except Exception as e:
+        return e
+
+
+async def process_pdb(engine, pdb_id):
+    """CSV row of one entry from the REST API (entry, then FASTA and polymer entities concurrently)."""
+    try:
+        data = await engine.get_json(f"{rcsb.RCSB_BASE_ENTRY}{pdb_id}")
+        entity_names = data.get("rcsb_entry_container_identifiers", {}).get("polymer_entity_ids", [])
+        fasta, *entities = await asyncio.gather(
+            engine.get_text(rcsb.FASTA_URL_TEMPLATE.format(pdb_id=pdb_id)),
+            *[engine.get_json(f"{rcsb.RCSB_BASE_POLYMER}/{pdb_id}/{entity}") for entity in entity_names],
+            return_exceptions=True)
+        return rcsb.rest_row(pdb_id, data, fasta, entities)
+    except Exception as e:
+        print(f"Error processing PDB ID {pdb_id}: {e}")
+        return None
+
+
+def graphql_body(chunk):
+    return {"query": rcsb.GRAPHQL_QUERY, "variables": {"ids": chunk}}
+
+
+def graphql_result(chunk, result):
+    """(pdb_id, row or None) of every entry of the chunk, result is the response or the error fetching it"""
+    if isinstance(result, Exception):
+        print(f"Error fetching {len(chunk)} entries from GraphQL: {result}")
+        rows = {}
+    else:
+        rows = rcsb.graphql_rows(result)
+    return [(pdb_id, rows.get(pdb_id.upper())) for pdb_id in chunk]
+
+
+class Backend:
+    """Fetches search results and csv rows through a Client
+
+    Subclasses decide how the requests are run. api is rest (several requests
+    per entry) or graphql (one request per graphql_chunk entries).
+    """
+    name = None
+
+    def __init__(self, client, api="rest", jobs=10, graphql_chunk=GRAPHQL_CHUNK):
+        if api not in APIS:
+            raise ValueError(f"Unknown api {api}, choose from {', '.join(APIS)}")
+        self.client = client
+        self.api = api
+        self.jobs = jobs
+        self.graphql_chunk = graphql_chunk
+
+    @property
+    def session(self):
+        return self.client.session
+
+    @property
+    def statistics(self):
+        return self.client.statistics
+
+    def chunks(self, pdb_ids):
+        pdb_ids = list(pdb_ids)
+        return [pdb_ids[i:i + self.graphql_chunk] for i in range(0, len(pdb_ids), self.graphql_chunk)]
+
+    def graphql_chunk_rows(self, chunk):
+        """(pdb_id, row or None) of a chunk of entries from one GraphQL request"""
+        return graphql_result(chunk, _result(self.client.post_json, rcsb.RCSB_GRAPHQL, graphql_body(chunk)))
+
+    def tasks(self, pdb_ids):
+        """Blocking calls returning lists of (pdb_id, row or None), one per entry (rest) or chunk (graphql)"""
+        if self.api == "graphql":
+            return [lambda chunk=chunk: self.graphql_chunk_rows(chunk) for chunk in self.chunks(pdb_ids)]
+        return [lambda pdb_id=pdb_id: [(pdb_id, rest_entry(self.client, pdb_id))] for pdb_id in pdb_ids]
+
+    def search(self, queries):
+        """PDB IDs ({pdb_id: [chains]}, None if the search failed) of every (uniprot, since) query"""
+        raise NotImplementedError
+
+    def fetch(self, pdb_ids, on_row):
+        """Call on_row(pdb_id, row or None) for every entry as soon as it is done (from the calling thread)"""
+        raise NotImplementedError
+
+
+class SerialBackend(Backend):
+    """One request after the other"""
+    name = "serial"
+
+    def search(self, queries):
+        return [get_list_of_pdbs(self.client, uniprot, since=since) for uniprot, since in queries]
+
+    def fetch(self, pdb_ids, on_row):
+        for task in self.tasks(pdb_ids):
+            for pdb_id, row in task():
+                on_row(pdb_id, row)
+
+
+class ThreadedBackend(Backend):
+    """Entries (or GraphQL chunks) in a pool of jobs threads, the requests of one entry run one after the other"""
+    name = "threaded"
+
+    def _run(self, tasks):
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            for future in as_completed([executor.submit(task) for task in tasks]):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def search(self, queries):
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(lambda query: get_list_of_pdbs(self.client, query[0], since=query[1]), queries))
+
+    def fetch(self, pdb_ids, on_row):
+        for rows in self._run(self.tasks(pdb_ids)):
+            for pdb_id, row in rows:
+                on_row(pdb_id, row)
+
+
+class AsyncBackend(Backend):
+    """asyncio with up to jobs requests in flight, the FASTA and polymer entities of an entry are fetched concurrently"""
+    name = "async"
+
+    async def _search(self, engine, uniprot, since):
+        try:
+            return rcsb.parse_search(await engine.post_json(rcsb.SEARCH_URL, rcsb.search_query(uniprot, since=since)))
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error fetching PDB list of {uniprot}: {e}")
+            return None
+
+    def search(self, queries):
+        async def search_all():
+            async with FetchEngine(self.client, concurrency=self.jobs) as engine:
+                return await asyncio.gather(*[self._search(engine, uniprot, since) for uniprot, since in queries])
+        return asyncio.run(search_all())
+
+    async def _graphql_chunk(self, engine, chunk):
+        try:
+            result = await engine.post_json(rcsb.RCSB_GRAPHQL, graphql_body(chunk))
+        except Exception as e:
+            result = e
+        return graphql_result(chunk, result)
+
+    async def _rest_entry(self, engine, pdb_id):
+        return [(pdb_id, await process_pdb(engine, pdb_id))]
+
+    def fetch(self, pdb_ids, on_row):
+        async def fetch_all():
+            async with FetchEngine(self.client, concurrency=self.jobs) as engine:
+                if self.api == "graphql":
+                    tasks = [self._graphql_chunk(engine, chunk) for chunk in self.chunks(pdb_ids)]
+                else:
+                    tasks = [self._rest_entry(engine, pdb_id) for pdb_id in pdb_ids]
+                for rows in asyncio.as_completed(tasks):
+                    for pdb_id, row in await rows:
+                        on_row(pdb_id, row)
+        asyncio.run(fetch_all())
+
+
+BACKENDS = {backend.name: backend for backend in [SerialBackend, ThreadedBackend, AsyncBackend]}
+
+
+def make_backend(name="async", session=None, api="rest", jobs=10, rate=None, retries=5, graphql_chunk=GRAPHQL_CHUNK):
+    """Backend by name, with a CachedSession unless another session is given"""
+    session = session if session is not None else CachedSession()
+    client = Client(session, pool_size=jobs, rate=rate, retries=retries)
+    return BACKENDS[name](client, api=api, jobs=jobs, graphql_chunk=graphql_chunk)
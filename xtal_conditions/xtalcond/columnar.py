@@ -0,0 +1,190 @@
+"""Typed columnar copy (Parquet or Arrow IPC) of a conditions csv, every sequence is stored once in a side table
+
+Needs pyarrow, the csv output works without it.
+"""
+import csv
+import hashlib
+import os
+
+# Rows converted and written at once (one row group / record batch)
+BATCH_SIZE = 50000
+SEQUENCES_SUFFIX = ".sequences"
+# Written for missing values by the row builders and older tables
+MISSING = {"", "-", "None", "nan"}
+
+# csv columns packing the cell into "x,y,z"
+CELL = {"LENGTH": ["CELL_A", "CELL_B", "CELL_C"], "ANGLE": ["CELL_ALPHA", "CELL_BETA", "CELL_GAMMA"]}
+FLOATS = {"RESOLUTION", "XTAL_TEMP"}
+INTEGERS = {"SG"}
+# Comma separated lists (author names contain commas and stay text)
+LISTS = {"UNIPROT_IDS"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Typed columnar output needs pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def sequence_hash(sequence):
+    """Key of a sequence in the side table"""
+    return hashlib.blake2b(sequence.encode(), digest_size=8).hexdigest()
+
+
+def sequences_file(out_file):
+    """Side table next to the table, harvest.parquet -> harvest.sequences.parquet"""
+    root, extension = os.path.splitext(out_file)
+    return f"{root}{SEQUENCES_SUFFIX}{extension}"
+
+
+def _number(convert, value):
+    if value in MISSING:
+        return None
+    try:
+        return convert(float(value))
+    except ValueError:
+        return None
+
+
+def _cell(value):
+    parts = value.split(",")
+    return [_number(float, part.strip()) for part in parts] if len(parts) == 3 else [None] * 3
+
+
+def schema(header):
+    """Arrow schema of the typed table of a csv header"""
+    pa = _pyarrow()
+    fields = []
+    for column in header:
+        if column in CELL:
+            fields += [pa.field(name, pa.float64()) for name in CELL[column]]
+        elif column == "FASTA":
+            fields.append(pa.field("SEQUENCE_HASH", pa.string()))
+        elif column in FLOATS:
+            fields.append(pa.field(column, pa.float64()))
+        elif column in INTEGERS:
+            fields.append(pa.field(column, pa.int32()))
+        elif column in LISTS:
+            fields.append(pa.field(column, pa.list_(pa.string())))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def typed_columns(header, rows, seen):
+    """Typed columns ({name: values}) of csv rows and the sequences not in seen ({hash: sequence}, seen is updated)"""
+    columns = {}
+    new_sequences = {}
+    for i, column in enumerate(header):
+        values = [row[i] for row in rows]
+        if column in CELL:
+            cells = [_cell(value) for value in values]
+            for j, name in enumerate(CELL[column]):
+                columns[name] = [cell[j] for cell in cells]
+        elif column == "FASTA":
+            hashes = []
+            for value in values:
+                if value in MISSING:
+                    hashes.append(None)
+                    continue
+                key = sequence_hash(value)
+                if key not in seen:
+                    seen.add(key)
+                    new_sequences[key] = value
+                hashes.append(key)
+            columns["SEQUENCE_HASH"] = hashes
+        elif column in FLOATS:
+            columns[column] = [_number(float, value) for value in values]
+        elif column in INTEGERS:
+            columns[column] = [_number(int, value) for value in values]
+        elif column in LISTS:
+            columns[column] = [value.split(", ") if value else [] for value in values]
+        else:
+            columns[column] = [None if value in MISSING else value for value in values]
+    return columns, new_sequences
+
+
+class _Writer:
+    """Parquet (.parquet) or Arrow IPC (.arrow/.feather) file written batch by batch, replaced atomically on close"""
+
+    def __init__(self, out_file, table_schema):
+        pa = _pyarrow()
+        self.out_file = out_file
+        self.tmp_file = f"{out_file}.{os.getpid()}.tmp"
+        if out_file.endswith(".parquet"):
+            self.writer = pa.parquet.ParquetWriter(self.tmp_file, table_schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            self.writer = pa.ipc.new_file(self.tmp_file, table_schema, options=options)
+
+    def write(self, table):
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.tmp_file, self.out_file)
+
+    def discard(self):
+        self.writer.close()
+        os.remove(self.tmp_file)
+
+
+def write_columnar(csv_file, out_file, batch_size=BATCH_SIZE):
+    """Write the typed table of csv_file to out_file and its sequences to sequences_file(out_file), returns (rows, sequences)
+
+    Cell, resolution, temperature and space group number become numeric columns
+    with nulls for missing values, FASTA becomes SEQUENCE_HASH referencing the
+    side table (SEQUENCE_HASH, SEQUENCE, LENGTH). Only batch_size rows are held
+    in memory.
+    """
+    pa = _pyarrow()
+    with open(csv_file, "r", newline="") as table:
+        reader = csv.reader(table)
+        header = next(reader)
+        table_schema = schema(header)
+        sequence_schema = pa.schema([pa.field("SEQUENCE_HASH", pa.string()), pa.field("SEQUENCE", pa.string()),
+                                     pa.field("LENGTH", pa.int32())])
+        writers = [_Writer(out_file, table_schema), _Writer(sequences_file(out_file), sequence_schema)]
+        try:
+            seen = set()
+            count = 0
+            while True:
+                rows = [row for _, row in zip(range(batch_size), reader)]
+                if not rows:
+                    break
+                columns, new_sequences = typed_columns(header, rows, seen)
+                writers[0].write(pa.table(columns, schema=table_schema))
+                writers[1].write(pa.table({"SEQUENCE_HASH": list(new_sequences), "SEQUENCE": list(new_sequences.values()),
+                                           "LENGTH": [len(sequence) for sequence in new_sequences.values()]}, schema=sequence_schema))
+                count += len(rows)
+        except BaseException:
+            for writer in writers:
+                writer.discard()
+            raise
+    for writer in writers:
+        writer.close()
+    return count, len(seen)
+
+
+def read_columnar(out_file, columns=None, filter=None, sequences=False):
+    """pyarrow Table of a typed table, only the columns and the rows matching filter are read
+
+    filter is a pyarrow.dataset expression, e.g. pyarrow.dataset.field("RESOLUTION") <= 2.0.
+    With sequences=True the SEQUENCE of every row is looked up in the side table.
+    """
+    pa = _pyarrow()
+    file_format = "parquet" if out_file.endswith(".parquet") else "ipc"
+    if sequences and columns is not None and "SEQUENCE_HASH" not in columns:
+        columns = list(columns) + ["SEQUENCE_HASH"]
+    table = pa.dataset.dataset(out_file, format=file_format).to_table(columns=columns, filter=filter)
+    if sequences:
+        side_table = pa.dataset.dataset(sequences_file(out_file), format=file_format).to_table(columns=["SEQUENCE_HASH", "SEQUENCE"])
+        positions = pa.compute.index_in(table["SEQUENCE_HASH"], value_set=side_table["SEQUENCE_HASH"])
+        table = table.append_column("SEQUENCE", side_table["SEQUENCE"].take(positions))
+    return table
+
@@ -0,0 +1,393 @@
+"""Structured crystallization conditions parsed from XTAL_DETAILS and an SQLite index for component and range queries"""
+import csv
+import os
+import re
+import sqlite3
+from dataclasses import dataclass, field
+
+INDEX_SUFFIX = ".conditions.sqlite"
+# Entries parsed and inserted at once while building the index
+BATCH_SIZE = 10000
+
+# Canonical name -> (kind, synonyms), synonyms match case-insensitively with optional spaces/hyphens
+REAGENTS = {
+    # Precipitants (PEGs are matched by PEG_PATTERN)
+    "MPD": ("precipitant", ["MPD", "2-methyl-2,4-pentanediol", "methylpentanediol"]),
+    "ethanol": ("precipitant", ["ethanol", "EtOH"]),
+    "isopropanol": ("precipitant", ["isopropanol", "2-propanol", "iso-propanol"]),
+    "ethylene glycol": ("precipitant", ["ethylene glycol"]),
+    "pentaerythritol ethoxylate": ("precipitant", ["pentaerythritol ethoxylate", "PEE"]),
+    "pentaerythritol propoxylate": ("precipitant", ["pentaerythritol propoxylate"]),
+    "jeffamine": ("precipitant", ["jeffamine"]),
+    "dioxane": ("precipitant", ["1,4-dioxane", "dioxane"]),
+    # Salts
+    "ammonium sulfate": ("salt", ["ammonium sulfate", "ammonium sulphate", "(NH4)2SO4", "AmSO4", "AS"]),
+    "lithium sulfate": ("salt", ["lithium sulfate", "lithium sulphate", "Li2SO4"]),
+    "sodium sulfate": ("salt", ["sodium sulfate", "sodium sulphate", "Na2SO4"]),
+    "magnesium sulfate": ("salt", ["magnesium sulfate", "magnesium sulphate", "MgSO4"]),
+    "potassium sulfate": ("salt", ["potassium sulfate", "potassium sulphate", "K2SO4"]),
+    "sodium chloride": ("salt", ["sodium chloride", "NaCl"]),
+    "potassium chloride": ("salt", ["potassium chloride", "KCl"]),
+    "lithium chloride": ("salt", ["lithium chloride", "LiCl"]),
+    "magnesium chloride": ("salt", ["magnesium chloride", "MgCl2"]),
+    "calcium chloride": ("salt", ["calcium chloride", "CaCl2"]),
+    "zinc chloride": ("salt", ["zinc chloride", "ZnCl2"]),
+    "nickel chloride": ("salt", ["nickel chloride", "nickel(II) chloride", "NiCl2"]),
+    "cobalt chloride": ("salt", ["cobalt chloride", "cobalt(II) chloride", "CoCl2"]),
+    "cadmium chloride": ("salt", ["cadmium chloride", "CdCl2"]),
+    "ammonium chloride": ("salt", ["ammonium chloride", "NH4Cl"]),
+    "ammonium acetate": ("salt", ["ammonium acetate"]),
+    "magnesium acetate": ("salt", ["magnesium acetate"]),
+    "zinc acetate": ("salt", ["zinc acetate"]),
+    "calcium acetate": ("salt", ["calcium acetate"]),
+    "ammonium formate": ("salt", ["ammonium formate"]),
+    "sodium formate": ("salt", ["sodium formate"]),
+    "magnesium formate": ("salt", ["magnesium formate"]),
+    "ammonium nitrate": ("salt", ["ammonium nitrate"]),
+    "sodium nitrate": ("salt", ["sodium nitrate", "NaNO3"]),
+    "potassium nitrate": ("salt", ["potassium nitrate", "KNO3"]),
+    "ammonium phosphate": ("salt", ["ammonium phosphate", "ammonium dihydrogen phosphate", "diammonium hydrogen phosphate"]),
+    "potassium phosphate": ("salt", ["potassium phosphate", "potassium dihydrogen phosphate", "dipotassium hydrogen phosphate"]),
+    "sodium phosphate": ("salt", ["sodium phosphate", "sodium dihydrogen phosphate", "disodium hydrogen phosphate"]),
+    "sodium malonate": ("salt", ["sodium malonate", "malonate"]),
+    "sodium tartrate": ("salt", ["sodium tartrate", "potassium sodium tartrate", "sodium potassium tartrate", "tartrate"]),
+    "ammonium citrate": ("salt", ["ammonium citrate", "tri-ammonium citrate"]),
+    "sodium thiocyanate": ("salt", ["sodium thiocyanate", "NaSCN"]),
+    "potassium thiocyanate": ("salt", ["potassium thiocyanate", "KSCN"]),
+    "sodium iodide": ("salt", ["sodium iodide", "NaI"]),
+    "potassium iodide": ("salt", ["potassium iodide", "KI"]),
+    "sodium bromide": ("salt", ["sodium bromide", "NaBr"]),
+    "tacsimate": ("salt", ["tacsimate"]),
+    # Buffers
+    "HEPES": ("buffer", ["HEPES", "Na-HEPES", "HEPES-Na", "HEPES sodium", "sodium HEPES", "HEPES-NaOH", "HEPES/NaOH"]),
+    "Tris": ("buffer", ["Tris", "Tris-HCl", "Tris HCl", "Tris/HCl", "Tris base", "Tris-Cl", "trizma"]),
+    "Bis-Tris": ("buffer", ["Bis-Tris", "BisTris"]),
+    "Bis-Tris propane": ("buffer", ["Bis-Tris propane", "BTP", "bis-tris-propane"]),
+    "MES": ("buffer", ["MES", "MES-NaOH", "MES/NaOH", "sodium MES"]),
+    "MOPS": ("buffer", ["MOPS"]),
+    "PIPES": ("buffer", ["PIPES"]),
+    "CHES": ("buffer", ["CHES"]),
+    "CAPS": ("buffer", ["CAPS"]),
+    "Tricine": ("buffer", ["tricine"]),
+    "Bicine": ("buffer", ["bicine"]),
+    "imidazole": ("buffer", ["imidazole"]),
+    "sodium citrate": ("buffer", ["sodium citrate", "tri-sodium citrate", "trisodium citrate", "citrate", "citric acid"]),
+    "sodium acetate": ("buffer", ["sodium acetate", "NaOAc", "acetate"]),
+    "sodium cacodylate": ("buffer", ["sodium cacodylate", "cacodylate"]),
+    "succinic acid": ("buffer", ["succinic acid", "succinate"]),
+    "glycine": ("buffer", ["glycine"]),
+    "MIB": ("buffer", ["MIB"]),
+    "SPG": ("buffer", ["SPG"]),
+    "MMT": ("buffer", ["MMT"]),
+    "PCTP": ("buffer", ["PCTP"]),
+    # Additives
+    "glycerol": ("additive", ["glycerol"]),
+    "DTT": ("additive", ["DTT", "dithiothreitol"]),
+    "TCEP": ("additive", ["TCEP"]),
+    "EDTA": ("additive", ["EDTA"]),
+    "sucrose": ("additive", ["sucrose"]),
+    "DMSO": ("additive", ["DMSO", "dimethyl sulfoxide"]),
+    "beta-mercaptoethanol": ("additive", ["beta-mercaptoethanol", "2-mercaptoethanol", "BME"]),
+}
+
+PEG_PATTERN = (r"(?:PEG|polyethylene\s*glycol|poly\(ethylene\s*glycol\))\s*[-_]?\s*"
+               r"(?P<mme>MME|monomethyl\s*ether|DME)?\s*[-_]?\s*(?P<weight>\d+(?:[,.]\d+)?)?\s*(?P<kilo>k\b)?"
+               r"(?:\s*(?P<mme_after>MME|monomethyl\s*ether)\b)?")
+CONCENTRATION_PATTERN = re.compile(
+    r"(?<![\w.])(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>mM|M|uM|µM|%)(?![a-z0-9])(?:\s*\(?\s*[wv]\s*/\s*[wv]\s*\)?)?",
+    re.IGNORECASE)
+PH_PATTERN = re.compile(r"\bpH\s*[:=]?\s*(?P<value>\d{1,2}(?:\.\d+)?)", re.IGNORECASE)
+# Components are separated by commas/semicolons/plus signs ("0,1 M" and "pH 7,5" decimal commas are fixed before)
+SEPARATOR_PATTERN = re.compile(r"[,;+]|\band\b", re.IGNORECASE)
+DECIMAL_COMMA_PATTERN = re.compile(r"(?<!\d)(\d),(\d+)(?=\s*(?:mM|M|%)(?![a-z]))|(?<=pH)(\s*\d{1,2}),(\d)", re.IGNORECASE)
+
+
+def _synonym_key(synonym):
+    return re.sub(r"[\s\-/]", "", synonym.lower())
+
+
+SYNONYMS = {_synonym_key(synonym): name for name, (_, synonyms) in REAGENTS.items() for synonym in synonyms}
+# Longest synonyms first so that "sodium citrate" wins over "citrate"
+REAGENT_PATTERN = re.compile(
+    rf"(?P<peg>{PEG_PATTERN})|(?P<reagent>"
+    + "|".join(r"[\s\-/]*".join(re.escape(part) for part in re.split(r"[\s\-/]+", synonym))
+               for synonym in sorted({s for _, synonyms in REAGENTS.values() for s in synonyms}, key=len, reverse=True))
+    + r")(?![\w-])",
+    re.IGNORECASE)
+# REAGENT_PATTERN is only tried at words that can start a reagent, scanning with it is much slower
+WORD_PATTERN = re.compile(r"(?<![\w\-(])[\w(]+")
+FIRST_WORDS = {WORD_PATTERN.match(synonym).group().lower() for _, synonyms in REAGENTS.values() for synonym in synonyms}
+FIRST_WORDS |= {"polyethylene", "poly(ethylene"}  # and every word starting with PEG
+# Abbreviations that are also words ("as described") only match in upper case
+CASE_SENSITIVE = {"as", "ki"}
+
+
+def _reagents(text):
+    """REAGENT_PATTERN matches of text"""
+    matches = []
+    position = 0
+    while True:
+        word = WORD_PATTERN.search(text, position)
+        if word is None:
+            return matches
+        key = word.group().lower()
+        match = REAGENT_PATTERN.match(text, word.start()) if key in FIRST_WORDS or key.startswith("peg") else None
+        if match and key in CASE_SENSITIVE and not match.group().isupper():
+            match = None
+        if match:
+            matches.append(match)
+            position = match.end()
+        else:
+            position = word.end()
+
+
+@dataclass
+class Component:
+    name: str
+    kind: str
+    concentration: float = None
+    unit: str = None  # M (mM/uM are converted) or %
+    ph: float = None
+
+
+@dataclass
+class Condition:
+    ph: float = None
+    components: list = field(default_factory=list)
+
+
+def _concentration(match):
+    """(value, unit) of a CONCENTRATION_PATTERN match in M or %"""
+    value, unit = float(match.group("value")), match.group("unit").lower()
+    if unit == "%":
+        return value, "%"
+    return value * {"mm": 1e-3, "um": 1e-6, "µm": 1e-6}.get(unit, 1.0), "M"
+
+
+def _peg_name(match):
+    weight = match.group("weight")
+    name = "PEG"
+    if match.group("mme") or match.group("mme_after"):
+        name += " MME"
+    if weight:
+        weight = float(weight.replace(",", "")) if "," in weight and len(weight.split(",")[1]) == 3 else float(weight.replace(",", "."))
+        if match.group("kilo"):
+            weight *= 1000
+        name += f" {weight:g}"
+    return name
+
+
+def _separator_before(text, start, end):
+    """Position after the last separator in text[start:end] (start if there is none)"""
+    position = start
+    for match in SEPARATOR_PATTERN.finditer(text, start, end):
+        position = match.end()
+    return position
+
+
+def _separator_after(text, start, end):
+    """Position of the first separator in text[start:end] (end if there is none)"""
+    match = SEPARATOR_PATTERN.search(text, start, end)
+    return match.start() if match else end
+
+
+def parse_conditions(details):
+    """Condition (pH and components with concentrations) of a free text crystallization description
+
+    A concentration right before a reagent ("0.1 M HEPES") is preferred over
+    one right after it ("PEG 3350 20%"), both must be in the same comma
+    separated part. The pH of an entry is the one given with its buffer, or the
+    first pH in the text.
+    """
+    if not details:
+        return Condition()
+    text = DECIMAL_COMMA_PATTERN.sub(lambda match: ".".join(group for group in match.groups() if group is not None), details)
+    reagents = _reagents(text)
+    concentrations = list(CONCENTRATION_PATTERN.finditer(text))
+    phs = [match for match in PH_PATTERN.finditer(text) if float(match.group("value")) <= 14]
+    used = set()
+
+    def closest(matches, start, end, last):
+        candidates = [match for match in matches if start <= match.start() and match.end() <= end and match.start() not in used]
+        if not candidates:
+            return None
+        match = candidates[-1] if last else candidates[0]
+        used.add(match.start())
+        return match
+
+    condition = Condition()
+    seen = set()
+    for i, match in enumerate(reagents):
+        previous_end = reagents[i - 1].end() if i else 0
+        next_start = reagents[i + 1].start() if i + 1 < len(reagents) else len(text)
+        if match.group("peg"):
+            name, kind = _peg_name(match), "precipitant"
+        else:
+            name = SYNONYMS.get(_synonym_key(match.group("reagent")))
+            if name is None:
+                continue
+            kind = REAGENTS[name][0]
+
+        concentration = closest(concentrations, _separator_before(text, previous_end, match.start()), match.start(), last=True) \
+            or closest(concentrations, match.end(), _separator_after(text, match.end(), next_start), last=False)
+        ph = closest(phs, match.end(), next_start, last=False) if kind == "buffer" else None
+        component = Component(name, kind, ph=float(ph.group("value")) if ph else None)
+        if concentration:
+            component.concentration, component.unit = _concentration(concentration)
+        if (name, component.concentration) not in seen:  # "PEG 3350 (PEG 3350)"
+            seen.add((name, component.concentration))
+            condition.components.append(component)
+
+    buffer_phs = [component.ph for component in condition.components if component.ph is not None]
+    condition.ph = buffer_phs[0] if buffer_phs else float(phs[0].group("value")) if phs else None
+    return condition
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    pdb_id TEXT NOT NULL UNIQUE,
+    ph REAL,
+    details TEXT
+);
+CREATE TABLE IF NOT EXISTS components (
+    entry INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    kind TEXT NOT NULL,
+    concentration REAL,
+    unit TEXT,
+    ph REAL,
+    PRIMARY KEY (entry, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS source (
+    csv_file TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS components_name ON components (name, unit, concentration);
+CREATE INDEX IF NOT EXISTS components_kind ON components (kind, name);
+CREATE INDEX IF NOT EXISTS entries_ph ON entries (ph);
+"""
+
+
+def index_file(csv_file):
+    return csv_file + INDEX_SUFFIX
+
+
+class ConditionIndex:
+    """Inverted index (component -> entries, pH) over the XTAL_DETAILS of a conditions table
+
+        index = ConditionIndex.for_csv("family.csv")
+        index.query(components=[("PEG 3350", 15, 25, "%"), "ammonium sulfate"], ph=(6.5, 7.5))
+    """
+
+    def __init__(self, store_file):
+        self.connection = sqlite3.connect(store_file)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    @classmethod
+    def for_csv(cls, csv_file, store_file=None, rebuild=False):
+        """Index next to the table, (re)built if it is missing or older than the table"""
+        index = cls(store_file or index_file(csv_file))
+        source = index.connection.execute("SELECT csv_file, mtime FROM source").fetchone()
+        if rebuild or source is None or source["mtime"] != os.path.getmtime(csv_file):
+            index.build(csv_file)
+        return index
+
+    def close(self):
+        self.connection.close()
+
+    def build(self, csv_file, batch_size=BATCH_SIZE):
+        """Parse the XTAL_DETAILS of every entry of the table, returns the number of entries"""
+        count = 0
+        parsed = {}  # Entries of a family often share the same screen condition
+        with self.connection, open(csv_file, "r", newline="") as table:
+            self.connection.execute("DELETE FROM components")
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("DELETE FROM source")
+            reader = csv.DictReader(table)
+            while True:
+                rows = [row for _, row in zip(range(batch_size), reader)]
+                if not rows:
+                    break
+                entries, components = [], []
+                for row in rows:
+                    count += 1
+                    details = row.get("XTAL_DETAILS")
+                    details = None if details in ("", "-") else details
+                    condition = parsed.get(details)
+                    if condition is None:
+                        condition = parsed[details] = parse_conditions(details)
+                    entries.append((count, row["PDB_ID"], condition.ph, details))
+                    components += [(count, position, component.name, component.kind, component.concentration, component.unit, component.ph)
+                                   for position, component in enumerate(condition.components)]
+                self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", entries)
+                self.connection.executemany("INSERT INTO components VALUES (?, ?, ?, ?, ?, ?, ?)", components)
+            self.connection.execute("INSERT INTO source VALUES (?, ?)", (os.path.abspath(csv_file), os.path.getmtime(csv_file)))
+        self.connection.execute("ANALYZE")
+        return count
+
+    def query(self, components=(), ph=None, kinds=()):
+        """Entries (pdb_id, ph, details, components) having all components, a pH within ph (min, max) and components of all kinds
+
+        A component is a name or (name, min, max[, unit]) with None for an open
+        end, concentrations are in M or %. A name ending in * matches all names
+        starting with it ("PEG*", "PEG MME*"), names are case insensitive.
+        """
+        conditions, parameters = [], []
+        for component in components:
+            name, low, high, unit = (component, None, None, None) if isinstance(component, str) else (tuple(component) + (None,))[:4]
+            if name.endswith("*"):
+                subquery = "SELECT entry FROM components WHERE name LIKE ?"  # Uses the index as name is COLLATE NOCASE
+                parameters.append(name[:-1] + "%")
+            else:
+                subquery = "SELECT entry FROM components WHERE name = ?"
+                parameters.append(name)
+            for column, operator, value in [("concentration", ">=", low), ("concentration", "<=", high), ("unit", "=", unit)]:
+                if value is not None:
+                    subquery += f" AND {column} {operator} ?"
+                    parameters.append(value)
+            conditions.append(f"e.id IN ({subquery})")
+        for kind in kinds:
+            conditions.append("e.id IN (SELECT entry FROM components WHERE kind = ?)")
+            parameters.append(kind)
+        if ph is not None:
+            for operator, value in zip([">=", "<="], ph):
+                if value is not None:
+                    conditions.append(f"e.ph {operator} ?")
+                    parameters.append(value)
+
+        sql = "SELECT e.id FROM entries e"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # Found entries are kept in a temporary table so that their components are read without searching again
+        self.connection.execute("DROP TABLE IF EXISTS temp.found")
+        self.connection.execute("CREATE TEMP TABLE found (id INTEGER PRIMARY KEY)")
+        self.connection.execute(f"INSERT INTO found {sql}", parameters)
+        # CROSS JOIN keeps the found entries as outer loop (the temporary table has no statistics)
+        entries = {row[0]: {"pdb_id": row[1], "ph": row[2], "details": row[3], "components": []}
+                   for row in self.connection.execute("SELECT e.id, e.pdb_id, e.ph, e.details FROM found CROSS JOIN entries e ON e.id = found.id")}
+        rows = self.connection.execute("SELECT c.entry, c.name, c.kind, c.concentration, c.unit, c.ph FROM found "
+                                       "CROSS JOIN components c ON c.entry = found.id ORDER BY found.id, c.position")
+        for row in rows:
+            entries[row[0]]["components"].append(Component(*row[1:]))
+        return sorted(entries.values(), key=lambda entry: entry["pdb_id"])
+
+    def summary(self, kind=None):
+        """Components with the number of entries and the concentration range, most frequent first"""
+        sql = ("SELECT name, kind, unit, COUNT(DISTINCT entry) AS entries, MIN(concentration) AS low, MAX(concentration) AS high "
+               "FROM components" + (" WHERE kind = ?" if kind else "") + " GROUP BY name, unit ORDER BY entries DESC, name")
+        return self.connection.execute(sql, [kind] if kind else []).fetchall()
+
+
+def format_component(component):
+    """0.1 M HEPES pH 7.5"""
+    text = component.name
+    if component.concentration is not None:
+        value = component.concentration * 1000 if component.unit == "M" and component.concentration < 0.1 else component.concentration
+        unit = "mM" if component.unit == "M" and component.concentration < 0.1 else component.unit
+        text = f"{value:g} {unit} {text}" if unit == "M" or unit == "mM" else f"{value:g}{unit} {text}"
+    if component.ph is not None:
+        text += f" pH {component.ph:g}"
+    return text
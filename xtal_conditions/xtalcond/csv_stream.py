@@ -0,0 +1,103 @@
+"""Rows streamed into a checkpoint journal, sorted into the final csv with an external merge sort"""
+import csv
+import heapq
+import json
+import os
+import tempfile
+import threading
+
+JOURNAL_SUFFIX = ".journal"
+# Rows sorted in memory at once by the external merge sort
+SORT_CHUNK = 50000
+
+
+class CheckpointedCsv:
+    """Append-only journal (one json line per finished entry) that becomes a sorted csv
+
+    Every row is flushed to the journal as soon as it is written, so an
+    interrupted run loses nothing. With resume=True the entries of an existing
+    journal are kept and listed in done, a torn last line is dropped.
+    """
+
+    def __init__(self, filename, columns, resume=False):
+        self.filename = filename
+        self.columns = columns
+        self.journal_file = filename + JOURNAL_SUFFIX
+        self.lock = threading.Lock()
+        self.done = set()
+        if resume and os.path.exists(self.journal_file):
+            self._recover()
+        else:
+            open(self.journal_file, "w").close()
+        self.journal = open(self.journal_file, "a", encoding="utf-8")
+
+    def _recover(self):
+        """Read the finished entries, cut the journal after the last complete line"""
+        valid = 0
+        with open(self.journal_file, "rb") as journal:
+            for line in journal:
+                try:
+                    self.done.add(json.loads(line)[0])
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break  # complete json but the newline is missing
+                valid += len(line)
+        with open(self.journal_file, "r+b") as journal:
+            journal.truncate(valid)
+
+    def write(self, key, row):
+        """Append the row of entry key (thread safe)"""
+        line = json.dumps([key, row]) + "\n"
+        with self.lock:
+            self.journal.write(line)
+            self.journal.flush()
+            self.done.add(key)
+
+    def close(self):
+        self.journal.close()
+
+    def finish(self, keep_journal=False, sort_key=None, sort_chunk=SORT_CHUNK):
+        """Write the csv sorted by key or sort_key(key) (duplicates of an entry are written once), returns the number of rows
+
+        Only sort_chunk rows are held in memory: sorted runs are written to
+        temporary files and merged. The journal is removed unless keep_journal.
+        """
+        self.close()
+        order = (lambda entry: entry[0]) if sort_key is None else (lambda entry: (sort_key(entry[0]), entry[0]))
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(self.filename))) as tmp_dir:
+            runs = []
+            with open(self.journal_file, "r", encoding="utf-8") as journal:
+                while True:
+                    chunk = [json.loads(line) for _, line in zip(range(sort_chunk), journal)]
+                    if not chunk:
+                        break
+                    chunk.sort(key=order)
+                    run_file = os.path.join(tmp_dir, f"run_{len(runs)}.jsonl")
+                    with open(run_file, "w", encoding="utf-8") as run:
+                        run.writelines(json.dumps(entry) + "\n" for entry in chunk)
+                    runs.append(run_file)
+
+            run_handles = [open(run_file, "r", encoding="utf-8") for run_file in runs]
+            try:
+                count = 0
+                previous = None
+                tmp_file = f"{self.filename}.{os.getpid()}.tmp"
+                with open(tmp_file, "w", newline="", encoding="utf-8") as out_file:
+                    writer = csv.writer(out_file, lineterminator="\n")
+                    writer.writerow(self.columns)
+                    merged = heapq.merge(*[map(json.loads, handle) for handle in run_handles], key=order)
+                    for key, row in merged:
+                        if key == previous:
+                            continue
+                        writer.writerow(["" if value is None else value for value in row])
+                        previous = key
+                        count += 1
+                os.replace(tmp_file, self.filename)
+            finally:
+                for handle in run_handles:
+                    handle.close()
+
+        if not keep_journal:
+            os.remove(self.journal_file)
+        return count
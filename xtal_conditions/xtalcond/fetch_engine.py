@@ -0,0 +1,157 @@
+"""Blocking client with a token bucket rate limit and retries with backoff, and an asyncio engine running it concurrently"""
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth another try, everything else is final
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """At most rate requests per second on average, bursts of up to capacity requests (thread safe)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after(response):
+    """Seconds the server asks us to wait (Retry-After as seconds or HTTP date), None if not given"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class Client:
+    """Requests of a (cached) requests.Session with rate limit and retries, safe to use from many threads
+
+    Up to pool_size connections are kept alive. Responses the session can answer
+    from its cache skip the rate limit. Connection errors, timeouts and
+    408/429/5xx responses are retried with exponential backoff and full jitter
+    (at least as long as a Retry-After header asks for). The duration of every
+    attempt is kept in latencies.
+    """
+
+    def __init__(self, session, pool_size=10, rate=None, retries=5, backoff=0.5, max_backoff=60.0, timeout=60):
+        self.session = session
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate) if rate else None
+        self.lock = threading.Lock()
+        self.statistics = {"requests": 0, "retries": 0, "failed": 0}
+        self.latencies = []
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def _count(self, name, latency=None):
+        with self.lock:
+            self.statistics[name] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def _delay(self, attempt, response):
+        """Backoff before the next attempt"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(delay, retry_after(response) or 0.0)
+
+    def request(self, method, url, **kwargs):
+        """Response of the request, raises requests.HTTPError/RequestException once all retries failed"""
+        kwargs.setdefault("timeout", self.timeout)
+        fresh = getattr(self.session, "fresh_response", None)
+        if fresh is not None:
+            response = fresh(method, url, params=kwargs.get("params"), data=kwargs.get("data"), json=kwargs.get("json"))
+            if response is not None:
+                return response
+
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                self._count("requests", time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} for url: {url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._count("requests", time.perf_counter() - start)
+                error = e
+            if attempt < self.retries:
+                self._count("retries")
+                time.sleep(self._delay(attempt, response))
+        self._count("failed")
+        raise error
+
+    def get_json(self, url, **kwargs):
+        return self.request("GET", url, **kwargs).json()
+
+    def get_text(self, url, **kwargs):
+        return self.request("GET", url, **kwargs).text
+
+    def post_json(self, url, body, **kwargs):
+        return self.request("POST", url, json=body, **kwargs).json()
+
+
+class FetchEngine:
+    """Runs the requests of a Client from asyncio, at most concurrency at once"""
+
+    def __init__(self, client, concurrency=10):
+        self.client = client
+        self.concurrency = concurrency
+
+    @property
+    def statistics(self):
+        return self.client.statistics
+
+    async def __aenter__(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def request(self, method, url, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(self.client.request, method, url, **kwargs))
+
+    async def get_json(self, url, **kwargs):
+        return (await self.request("GET", url, **kwargs)).json()
+
+    async def get_text(self, url, **kwargs):
+        return (await self.request("GET", url, **kwargs)).text
+
+    async def post_json(self, url, body, **kwargs):
+        return (await self.request("POST", url, json=body, **kwargs)).json()
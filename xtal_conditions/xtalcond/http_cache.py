@@ -0,0 +1,207 @@
+"""Persistent HTTP response cache (SQLite) for the RCSB requests of xtal_conditions"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                          "misc_xtal_stuff", "http_cache.sqlite")
+# Responses younger than this are used without asking the server
+CACHE_TTL = 24 * 3600
+# Least recently used responses are removed once the cache grows beyond this size
+CACHE_SIZE = 500 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def request_key(method, url, params=None, data=None, json_body=None):
+    """Cache key of a request, the body is part of it (search queries are POSTs)"""
+    key = hashlib.sha256()
+    key.update(f"{method.upper()} {url}".encode())
+    if params:
+        key.update(json.dumps(params, sort_keys=True).encode())
+    if data:
+        key.update(data if isinstance(data, bytes) else json.dumps(data, sort_keys=True).encode())
+    if json_body is not None:
+        key.update(json.dumps(json_body, sort_keys=True).encode())
+    return key.hexdigest()
+
+
+class ResponseCache:
+    """Responses stored in SQLite, safe to use from many threads"""
+
+    def __init__(self, cache_file=CACHE_FILE, max_size=CACHE_SIZE):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        # Running total of the stored bytes, so that put() does not sum the whole table
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, key):
+        """Stored response as dict (status, headers, body, fetched) or None"""
+        with self.lock:
+            row = self.connection.execute("SELECT url, status, headers, body, fetched FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        url, status, headers, body, fetched = row
+        return {"url": url, "status": status, "headers": json.loads(headers), "body": body, "fetched": fetched}
+
+    def put(self, key, url, status, headers, body):
+        """Store a response and evict old ones if the cache is too large"""
+        now = time.time()
+        with self.lock, self.connection:
+            replaced = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (key, url, status, json.dumps(dict(headers)), body, now, now, len(body)))
+            self.size += len(body) - (replaced[0] if replaced else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def touch(self, key):
+        """Mark a response as fresh again (server answered 304 Not Modified)"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE responses SET fetched = ?, accessed = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self):
+        """Remove least recently used responses until the cache fits into max_size bytes"""
+        # Recounted here as other processes may share the cache file
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.size = total
+        if total <= self.max_size:
+            return
+        removed = []
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= self.max_size:
+                break
+            removed.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", removed)
+        self.size = total
+
+
+def _response(url, status, headers, body):
+    """requests.Response from stored parts"""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    return response
+
+
+class CachedSession(requests.Session):
+    """requests.Session answering GET/POST requests from a ResponseCache
+
+    Responses younger than ttl seconds are returned without a request, older ones
+    are revalidated with ETag/Last-Modified (If-None-Match/If-Modified-Since) if
+    the server sent them. Concurrent requests of the same resource are coalesced
+    into one download. Only successful responses are stored.
+    """
+
+    def __init__(self, cache=None, ttl=CACHE_TTL):
+        super().__init__()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.ttl = ttl
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.statistics = {"hits": 0, "revalidated": 0, "downloads": 0, "coalesced": 0}
+        self.statistics_lock = threading.Lock()
+
+    def _count(self, name):
+        with self.statistics_lock:
+            self.statistics[name] += 1
+
+    def fresh_response(self, method, url, params=None, data=None, json=None):
+        """Cached response younger than ttl, None if the request has to go to the server"""
+        if method.upper() not in ("GET", "POST"):
+            return None
+        cached = self.cache.get(request_key(method, url, params, data, json))
+        if cached is None or time.time() - cached["fetched"] >= self.ttl:
+            return None
+        self._count("hits")
+        return _response(cached["url"], cached["status"], cached["headers"], cached["body"])
+
+    def request(self, method, url, params=None, data=None, headers=None, json=None, **kwargs):
+        if method.upper() not in ("GET", "POST"):
+            return super().request(method, url, params=params, data=data, headers=headers, json=json, **kwargs)
+
+        key = request_key(method, url, params, data, json)
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+            else:
+                self._count("coalesced")
+        if not owner:
+            return _response(*future.result())
+
+        try:
+            parts = self._fetch(key, method, url, params, data, headers, json, **kwargs)
+            future.set_result(parts)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+        return _response(*parts)
+
+    def _fetch(self, key, method, url, params, data, headers, json_body, **kwargs):
+        """(url, status, headers, body) from the cache, after revalidation or downloaded"""
+        cached = self.cache.get(key)
+        if cached is not None and time.time() - cached["fetched"] < self.ttl:
+            self._count("hits")
+            return cached["url"], cached["status"], cached["headers"], cached["body"]
+
+        headers = dict(headers or {})
+        if cached is not None:
+            stored = CaseInsensitiveDict(cached["headers"])
+            if "ETag" in stored:
+                headers["If-None-Match"] = stored["ETag"]
+            if "Last-Modified" in stored:
+                headers["If-Modified-Since"] = stored["Last-Modified"]
+
+        response = super().request(method, url, params=params, data=data, headers=headers, json=json_body, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.touch(key)
+            self._count("revalidated")
+            return cached["url"], cached["status"], cached["headers"], cached["body"]
+
+        self._count("downloads")
+        if response.status_code == 200 and "no-store" not in response.headers.get("Cache-Control", ""):
+            # Body is stored decoded, the stored headers must not claim otherwise
+            stored_headers = {name: value for name, value in response.headers.items()
+                              if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+            self.cache.put(key, response.url, response.status_code, stored_headers, response.content)
+            return response.url, response.status_code, stored_headers, response.content
+        return response.url, response.status_code, dict(response.headers), response.content
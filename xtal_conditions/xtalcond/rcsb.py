@@ -0,0 +1,258 @@
+"""RCSB endpoints, search queries and the csv rows built from RCSB documents (no requests are made here)"""
+import requests
+
+# Read at call time, set_server points them to another server (e.g. mock_rcsb.py)
+RCSB_BASE_ENTRY = "https://data.rcsb.org/rest/v1/core/entry/"
+RCSB_BASE_POLYMER = "https://data.rcsb.org/rest/v1/core/polymer_entity"
+FASTA_URL_TEMPLATE = "https://www.rcsb.org/fasta/entry/{pdb_id}/display"
+SEARCH_URL = "https://search.rcsb.org/rcsbsearch/v2/query"
+RCSB_GRAPHQL = "https://data.rcsb.org/graphql"
+
+COLUMNS = [
+    "PDB_ID",
+    "EXPRESSION_SYSTEM",
+    "RESOLUTION",
+    "SYMMETRY",
+    "SG",
+    "ANGLE",
+    "LENGTH",
+    "XTAL_DETAILS",
+    "XTAL_TEMP",
+    "XTAL_METHOD",
+    "CITATION",
+    "AUTHOR_LIST",
+    "FASTA"
+]
+
+# Everything the csv needs, for many entries at once
+GRAPHQL_QUERY = """
+query xtal_conditions($ids: [String!]!) {
+  entries(entry_ids: $ids) {
+    rcsb_id
+    exptl_crystal_grow { pdbx_details temp method }
+    audit_author { name }
+    citation { pdbx_database_id_DOI journal_abbrev }
+    rcsb_entry_info { diffrn_resolution_high { value } }
+    cell { angle_alpha angle_beta angle_gamma length_a length_b length_c }
+    symmetry { space_group_name_H_M Int_Tables_number }
+    polymer_entities {
+      rcsb_id
+      entity_poly { pdbx_seq_one_letter_code_can }
+      rcsb_entity_host_organism { ncbi_scientific_name }
+    }
+  }
+}
+"""
+
+
+def set_server(base_url):
+    """Send all requests to base_url (same paths as mock_rcsb.py)"""
+    global RCSB_BASE_ENTRY, RCSB_BASE_POLYMER, FASTA_URL_TEMPLATE, SEARCH_URL, RCSB_GRAPHQL
+    base_url = base_url.rstrip("/")
+    RCSB_BASE_ENTRY = f"{base_url}/rest/v1/core/entry/"
+    RCSB_BASE_POLYMER = f"{base_url}/rest/v1/core/polymer_entity"
+    FASTA_URL_TEMPLATE = base_url + "/fasta/entry/{pdb_id}/display"
+    SEARCH_URL = f"{base_url}/rcsbsearch/v2/query"
+    RCSB_GRAPHQL = f"{base_url}/graphql"
+
+
+def search_query(uniprot, result_type="entry", since=None):
+    """RCSB search query for the X-ray structures (<= 3 A) of a UniProt ID, released or revised since the date (YYYY-MM-DD) if given."""
+    query = {
+        "query": {
+            "type": "group",
+            "logical_operator": "and",
+            "nodes": [
+                {
+                    "type": "terminal",
+                    "service": "text",
+                    "parameters": {
+                        "operator": "exact_match",
+                        "value": uniprot,
+                        "attribute": "rcsb_polymer_entity_container_identifiers.reference_sequence_identifiers.database_accession"
+                    }
+                },
+                {
+                    "type": "terminal",
+                    "service": "text",
+                    "parameters": {
+                        "operator": "exact_match",
+                        "value": "UniProt",
+                        "attribute": "rcsb_polymer_entity_container_identifiers.reference_sequence_identifiers.database_name"
+                    }
+                },
+                {
+                    "type": "terminal",
+                    "service": "text",
+                    "parameters": {
+                        "operator": "exact_match",
+                        "value": "X-RAY DIFFRACTION",
+                        "attribute": "exptl.method"
+                    }
+                },
+                {
+                    "type": "terminal",
+                    "service": "text",
+                    "parameters": {
+                        "operator": "less_or_equal",
+                        "value": 3.0,  # 2.5
+                        "attribute": "rcsb_entry_info.resolution_combined"
+                    }
+                }
+            ]
+        },
+        "request_options": {
+            "return_all_hits": True,
+        },
+        "return_type": result_type
+    }
+    if since:
+        query["query"]["nodes"].append({
+            "type": "group",
+            "logical_operator": "or",
+            "nodes": [
+                {
+                    "type": "terminal",
+                    "service": "text",
+                    "parameters": {
+                        "operator": "greater_or_equal",
+                        "value": since,
+                        "attribute": attribute
+                    }
+                }
+                for attribute in ["rcsb_accession_info.initial_release_date", "rcsb_accession_info.revision_date"]
+            ]
+        })
+    return query
+
+
+def parse_search(results):
+    """PDB IDs (with chains for instance results) of a search response, {pdb_id: [chains]}."""
+    pdb_list = [result["identifier"] for result in results.get("result_set", [])]
+
+    pdb_dict = {}
+    for pdb in pdb_list:
+        try:
+            pdb_id, chain_id = pdb.split(".")
+            pdb_dict.setdefault(pdb_id, []).append(chain_id)
+        except ValueError:
+            pdb_dict.setdefault(pdb, [])
+
+    return pdb_dict
+
+
+def fasta_sequence(fastas):
+    """All sequences of a FASTA text joined into one string."""
+    fasta_list = [line for line in fastas.split('\n') if line and not line.startswith('>')]
+    return ''.join(fasta_list)
+
+
+def host_organism(entity):
+    """Expression system of a polymer entity document."""
+    return entity.get("rcsb_entity_host_organism", [{}])[0].get("ncbi_scientific_name", "-")
+
+
+def xtal_row(pdb_id, data, expression_system, fasta):
+    """CSV row of one entry from its (REST shaped) entry document."""
+    # Xtal details
+    xtal_details = data.get("exptl_crystal_grow", [{}])[0].get("pdbx_details", "-")
+    xtal_temp = data.get("exptl_crystal_grow", [{}])[0].get("temp", "-")
+    xtal_method = data.get("exptl_crystal_grow", [{}])[0].get("method", "-")
+
+    # Author Information
+    author_list = [author.get("name", "") for author in data.get("audit_author", [])]
+
+    # Citation
+    citation = data.get("citation", [{}])[0].get("pdbx_database_id_doi") or \
+               data.get("citation", [{}])[0].get("journal_abbrev", "-")
+
+    # Resolution
+    resolution = data.get("rcsb_entry_info", {}).get("diffrn_resolution_high", {}).get("value", "-")
+
+    # Cell data
+    cell = data.get("cell", {})
+    alpha = cell.get("angle_alpha", "-")
+    beta = cell.get("angle_beta", "-")
+    gamma = cell.get("angle_gamma", "-")
+    a = cell.get("length_a", "-")
+    b = cell.get("length_b", "-")
+    c = cell.get("length_c", "-")
+
+    # Symmetry
+    symmetry = data.get("symmetry", {}).get("space_group_name_hm", "-")
+    sg = data.get("symmetry", {}).get("int_tables_number", "-")
+
+    return [
+        pdb_id,
+        expression_system,
+        resolution,
+        symmetry,
+        sg,
+        f"{alpha},{beta},{gamma}",
+        f"{a},{b},{c}",
+        xtal_details,
+        xtal_temp,
+        xtal_method,
+        citation,
+        ", ".join(author_list),
+        fasta
+    ]
+
+
+def missing(result):
+    """Optional sub-resource: 404 becomes "-", other errors (after all retries) fail the entry."""
+    if isinstance(result, requests.HTTPError) and result.response is not None and result.response.status_code == 404:
+        return True
+    if isinstance(result, BaseException):
+        raise result
+    return False
+
+
+def rest_row(pdb_id, data, fasta, entities):
+    """CSV row from the REST entry document, the FASTA text and the polymer entity documents (or the errors fetching them)."""
+    fasta = "-" if missing(fasta) else fasta_sequence(fasta)
+    expression_systems = set()
+    for entity in entities:
+        try:
+            expression_systems.add("-" if missing(entity) else host_organism(entity))
+        except (IndexError, KeyError):
+            expression_systems.add("-")
+    expression_system = ", ".join(sorted(expression_systems)) if expression_systems else "-"
+    return xtal_row(pdb_id, data, expression_system, fasta)
+
+
+def graphql_entry(entry):
+    """Entry of the GraphQL API in the shape of the REST entry document (mmCIF case -> lower case)."""
+    data = dict(entry)
+    data["citation"] = [{**citation, "pdbx_database_id_doi": citation.get("pdbx_database_id_DOI")}
+                        for citation in entry.get("citation") or [{}]]
+    symmetry = entry.get("symmetry") or {}
+    data["symmetry"] = {"space_group_name_hm": symmetry.get("space_group_name_H_M", "-"),
+                        "int_tables_number": symmetry.get("Int_Tables_number", "-")}
+    # GraphQL returns null for missing categories, the REST document leaves them out
+    return {key: value for key, value in data.items() if value is not None}
+
+
+def graphql_row(entry):
+    """CSV row of one entry of a GraphQL response."""
+    # Entity order of the FASTA file, 1ABC_10 after 1ABC_2
+    entities = sorted(entry.get("polymer_entities") or [], key=lambda entity: int(entity["rcsb_id"].rsplit("_", 1)[1]))
+    expression_systems = set()
+    sequences = []
+    for entity in entities:
+        hosts = entity.get("rcsb_entity_host_organism") or [{}]
+        expression_systems.add(hosts[0].get("ncbi_scientific_name") or "-")
+        sequences.append((entity.get("entity_poly") or {}).get("pdbx_seq_one_letter_code_can") or "")
+    expression_system = ", ".join(sorted(expression_systems)) if expression_systems else "-"
+    return xtal_row(entry["rcsb_id"], graphql_entry(entry), expression_system, "".join(sequences).replace("\n", "") or "-")
+
+
+def graphql_rows(result):
+    """Rows of a GraphQL response, {pdb_id: row}."""
+    for error in result.get("errors") or []:
+        print(f"GraphQL error: {error.get('message', error)}")
+    rows = {}
+    for entry in (result.get("data") or {}).get("entries") or []:
+        if entry:
+            rows[entry["rcsb_id"].upper()] = graphql_row(entry)
+    return rows
@@ -0,0 +1,270 @@
+"""Crystallization condition tables: one UniProt ID, many UniProt IDs and in place updates (sync)"""
+import csv
+import datetime
+import json
+import os
+
+from .csv_stream import CheckpointedCsv
+from .http_cache import CachedSession
+from .rcsb import COLUMNS
+
+# Date of the last complete run next to the csv, for sync
+SYNC_SUFFIX = ".sync"
+
+
+def fetch_rows(backend, pdb_ids, output, extra_columns=None, columns=None):
+    """Stream the rows of the entries into output (CheckpointedCsv), returns the failed IDs.
+
+    extra_columns ({name: {pdb_id: value}}) are appended to every row, columns
+    selects (and orders) the COLUMNS that are written.
+    """
+    indices = [COLUMNS.index(column) for column in columns or COLUMNS]
+    error_list = []
+
+    def on_row(pdb_id, row):
+        if row:
+            output.write(pdb_id, [row[i] for i in indices] + [values.get(pdb_id, "") for values in (extra_columns or {}).values()])
+        else:
+            error_list.append(pdb_id)
+
+    backend.fetch(list(pdb_ids), on_row)
+    if error_list:
+        print("Errors in the following IDs:", error_list)
+    return error_list
+
+
+def sync_rows(backend, pdb_ids, revised, output, extra_columns=None):
+    """Update the existing table of output in place, returns the failed IDs.
+
+    pdb_ids are all entries of the current search, revised the entries released
+    or revised since the last run. Rows of unchanged entries are copied, entries
+    no longer found are dropped and only new and revised entries are fetched. A
+    revised entry that fails keeps its old row.
+    """
+    def extras(pdb_id):
+        return [values.get(pdb_id, "") for values in (extra_columns or {}).values()]
+
+    width = len(output.columns) - len(extra_columns or {})
+    old_rows = {}
+    dropped = 0
+    with open(output.filename, "r", newline="") as table:
+        reader = csv.reader(table)
+        if next(reader, None) != output.columns:
+            print(f"'{output.filename}' has different columns, fetching all entries.")
+            reader = []
+        for row in reader:
+            if row[0] not in pdb_ids:
+                dropped += 1  # obsoleted or no longer matching the search
+            elif row[0] in revised:
+                old_rows[row[0]] = row[:width]
+            else:
+                output.write(row[0], row[:width] + extras(row[0]))
+
+    todo = [pdb_id for pdb_id in pdb_ids if pdb_id not in output.done]
+    print(f"Sync: {len(output.done)} entries unchanged, {len(todo) - len(old_rows)} new, {len(old_rows)} revised, {dropped} dropped")
+    error_list = fetch_rows(backend, todo, output, extra_columns, columns=output.columns[:width])
+    for pdb_id in error_list:
+        if pdb_id in old_rows:
+            output.write(pdb_id, old_rows[pdb_id] + extras(pdb_id))
+    return error_list
+
+
+def finish_csv(output, error_list, retry="-resume", sort_key=None):
+    """Sort the journal into the csv, the journal is kept if entries failed (retry them with -resume)."""
+    count = output.finish(keep_journal=bool(error_list), sort_key=sort_key)
+    print(f"CSV file '{output.filename}' created successfully with {count} entries.")
+    if error_list:
+        print(f"{len(error_list)} entries failed, rerun with {retry} to only fetch those.")
+
+
+def print_statistics(backend):
+    print("Requests: {requests} sent, {retries} retried, {failed} failed".format(**backend.statistics))
+    if isinstance(backend.session, CachedSession):
+        print("HTTP cache: {hits} hits, {revalidated} revalidated, {downloads} downloads, {coalesced} coalesced".format(**backend.session.statistics))
+
+
+def sync_file(filename):
+    return filename + SYNC_SUFFIX
+
+
+def last_sync(filename, uniprot_ids):
+    """Date (YYYY-MM-DD) of the last complete run that wrote filename for the same UniProt IDs, None if everything has to be fetched."""
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(sync_file(filename), "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        # Tables written before sync existed: all entries were fetched before the file was written
+        return datetime.date.fromtimestamp(os.path.getmtime(filename)).isoformat()
+    if sorted(state.get("uniprot_ids", [])) != sorted(uniprot_ids):
+        print(f"'{filename}' was written for {', '.join(state.get('uniprot_ids', []))}, fetching all entries.")
+        return None
+    return state.get("synced")
+
+
+def save_sync(filename, started, uniprot_ids):
+    """Remember the start date of a complete run, the next sync asks for entries released or revised since then."""
+    with open(sync_file(filename), "w") as f:
+        json.dump({"synced": started, "uniprot_ids": list(uniprot_ids)}, f)
+
+
+def start_sync(backend, filename, uniprot_ids):
+    """Date of the last run for sync, responses are revalidated as only new and revised entries are fetched."""
+    since = last_sync(filename, uniprot_ids)
+    if since is None:
+        print(f"No previous run found for '{filename}', fetching all entries.")
+        return None
+    print(f"Fetching entries released or revised since {since}.")
+    if isinstance(backend.session, CachedSession):
+        backend.session.ttl = 0
+    return since
+
+
+def make_xtal_csv(backend, pdb_dict, filename, resume=False, revised=None, columns=None, keep_order=False):
+    """Make a CSV file with the crystallographic conditions for each PDB in the list, returns the failed IDs.
+
+    Rows are journaled as they arrive, with resume=True entries of an
+    interrupted run are not fetched again. With revised (entries released or
+    revised since the last run) the existing table is updated instead, see
+    sync_rows. columns selects the COLUMNS that are written, the rows are sorted
+    by PDB ID unless keep_order (order of pdb_dict).
+    """
+    output = CheckpointedCsv(filename, columns or COLUMNS, resume=resume and revised is None)
+    todo = [pdb_id for pdb_id in pdb_dict if pdb_id not in output.done]
+    if resume and revised is None:
+        print(f"Resuming: {len(pdb_dict) - len(todo)} entries already done, {len(todo)} to fetch.")
+
+    try:
+        if revised is not None:
+            error_list = sync_rows(backend, pdb_dict, revised, output)
+        else:
+            error_list = fetch_rows(backend, todo, output, columns=columns)
+    except KeyboardInterrupt:
+        output.close()
+        print(f"Interrupted, {len(output.done)} entries are saved in '{output.journal_file}', continue with -resume.")
+        raise
+    order = {pdb_id: index for index, pdb_id in enumerate(pdb_dict)}
+    finish_csv(output, error_list, retry="-sync" if revised is not None else "-resume",
+               sort_key=(lambda pdb_id: order.get(pdb_id, len(order))) if keep_order else None)
+    print_statistics(backend)
+    return error_list
+
+
+def xtal_table(backend, uniprot_id, filename, resume=False, sync=False, columns=None, keep_order=False):
+    """Table of all X-ray structures of a UniProt ID, with sync=True an existing table is updated, returns the failed IDs."""
+    started = datetime.date.today().isoformat()
+    since = start_sync(backend, filename, [uniprot_id]) if sync else None
+    results = backend.search([(uniprot_id, None)] + ([(uniprot_id, since)] if since else []))
+    pdb_dict, revised = results[0], results[1] if since else None
+    if not pdb_dict:
+        print("No PDB IDs found for the given UniProt ID.")
+        return None
+    if since and revised is None:
+        print(f"'{filename}' was not changed.")
+        return None
+    error_list = make_xtal_csv(backend, pdb_dict, filename, resume=resume, revised=revised, columns=columns, keep_order=keep_order)
+    if not error_list:
+        save_sync(filename, started, [uniprot_id])
+    return error_list
+
+
+def read_uniprot_ids(uniprot_file):
+    """UniProt IDs of a file, one per line (or separated by spaces/commas), # starts a comment."""
+    uniprot_ids = []
+    with open(uniprot_file, "r") as f:
+        for line in f:
+            for uniprot in line.split("#")[0].replace(",", " ").split():
+                if uniprot not in uniprot_ids:
+                    uniprot_ids.append(uniprot)
+    return uniprot_ids
+
+
+def table_uniprot_ids(filename):
+    """UniProt IDs of every entry of an existing combined table, {pdb_id: [uniprot]}"""
+    try:
+        with open(filename, "r", newline="") as table:
+            reader = csv.reader(table)
+            if next(reader, None) != COLUMNS + ["UNIPROT_IDS"]:
+                return {}
+            return {row[0]: row[-1].split(", ") for row in reader if row}
+    except OSError:
+        return {}
+
+
+def make_batch_csv(backend, uniprot_ids, filename, outdir=None, resume=False, sync=False):
+    """Search all UniProt IDs concurrently and fetch every PDB entry found only once, returns the failed IDs.
+
+    Writes the combined table filename with the matching UniProt IDs of every
+    entry and one csv per UniProt ID (UNIPROT.csv in outdir), split from the
+    sorted combined table. With sync=True only entries released or revised
+    since the last run are fetched into the existing combined table.
+    """
+    started = datetime.date.today().isoformat()
+    since = start_sync(backend, filename, uniprot_ids) if sync else None
+    outdir = outdir or os.path.dirname(os.path.abspath(filename))
+    os.makedirs(outdir, exist_ok=True)
+    output = CheckpointedCsv(filename, COLUMNS + ["UNIPROT_IDS"], resume=resume and not since)
+
+    queries = [(uniprot, None) for uniprot in uniprot_ids] + [(uniprot, since) for uniprot in uniprot_ids if since]
+    results = backend.search(queries)
+    searches, revised_searches = results[:len(uniprot_ids)], results[len(uniprot_ids):]
+    pdb_ids = {}
+    for uniprot, pdb_dict in zip(uniprot_ids, searches):
+        for pdb_id in pdb_dict or {}:
+            pdb_ids.setdefault(pdb_id, []).append(uniprot)
+    total = sum(len(pdb_dict or {}) for pdb_dict in searches)
+    failed = [uniprot for uniprot, pdb_dict in zip(uniprot_ids, searches) if pdb_dict is None]
+    failed += [uniprot for uniprot, pdb_dict in zip(uniprot_ids, revised_searches) if pdb_dict is None and uniprot not in failed]
+    if failed:
+        # The table must not lose the entries of a failed search, they are kept from the existing table
+        for pdb_id, uniprots in table_uniprot_ids(filename).items():
+            for uniprot in uniprots:
+                if uniprot in failed and uniprot not in pdb_ids.get(pdb_id, []):
+                    pdb_ids.setdefault(pdb_id, []).append(uniprot)
+        print(f"Search failed for {', '.join(failed)}, their entries in '{filename}' are kept (run again to update them).")
+    uniprot_column = {pdb_id: ", ".join(uniprots) for pdb_id, uniprots in pdb_ids.items()}
+
+    try:
+        if since:
+            print(f"{len(pdb_ids)} unique PDB entries in {total} search hits of {len(uniprot_ids)} UniProt IDs")
+            # Kept entries of failed searches are not in revised and are copied unchanged
+            revised = {pdb_id for uniprot, pdb_dict in zip(uniprot_ids, revised_searches) if uniprot not in failed for pdb_id in pdb_dict}
+            error_list = sync_rows(backend, pdb_ids, revised, output, extra_columns={"UNIPROT_IDS": uniprot_column})
+        else:
+            todo = [pdb_id for pdb_id in pdb_ids if pdb_id not in output.done]
+            print(f"{len(pdb_ids)} unique PDB entries in {total} search hits of {len(uniprot_ids)} UniProt IDs, {len(todo)} to fetch")
+            error_list = fetch_rows(backend, todo, output, extra_columns={"UNIPROT_IDS": uniprot_column})
+    except KeyboardInterrupt:
+        output.close()
+        print(f"Interrupted, {len(output.done)} entries are saved in '{output.journal_file}', continue with -resume.")
+        raise
+    finish_csv(output, error_list, retry="-sync" if since else "-resume")
+
+    # Split the sorted combined table, every file stays sorted
+    searched = [uniprot for uniprot, pdb_dict in zip(uniprot_ids, searches) if pdb_dict is not None]
+    for uniprot, pdb_dict in zip(uniprot_ids, searches):
+        if pdb_dict == {}:
+            print(f"No PDB IDs found for {uniprot}.")
+    out_files = {uniprot: open(os.path.join(outdir, f"{uniprot}.csv"), "w", newline="") for uniprot in searched}
+    try:
+        writers = {uniprot: csv.writer(out_file, lineterminator="\n") for uniprot, out_file in out_files.items()}
+        counts = dict.fromkeys(searched, 0)
+        for writer in writers.values():
+            writer.writerow(COLUMNS)
+        with open(filename, "r", newline="") as combined:
+            reader = csv.reader(combined)
+            next(reader)
+            for row in reader:
+                for uniprot in row[-1].split(", "):
+                    if uniprot in writers:
+                        writers[uniprot].writerow(row[:-1])
+                        counts[uniprot] += 1
+    finally:
+        for out_file in out_files.values():
+            out_file.close()
+    print(f"{len(searched)} per UniProt CSV files written to '{outdir}' ({sum(counts.values())} rows).")
+    print_statistics(backend)
+    if not error_list and not failed:
+        save_sync(filename, started, uniprot_ids)
+    return error_list